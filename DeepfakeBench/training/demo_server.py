@@ -17,11 +17,9 @@ import yaml
 import torch
 import torch.nn as nn
 from torchvision import transforms
-from PIL import Image as pil_image
 import dlib
 from imutils import face_utils
 from skimage import transform as trans
-import torchvision.transforms as T
 from pathlib import Path
 from typing import Tuple, List, Dict
 import argparse
@@ -36,6 +34,12 @@ from .detectors import DETECTOR
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# CLIP input normalization, folded into a per-channel scale and offset for preprocess_face
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32).reshape(3, 1, 1)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32).reshape(3, 1, 1)
+PREPROCESS_SCALE = 1.0 / (255.0 * CLIP_STD)
+PREPROCESS_OFFSET = CLIP_MEAN / CLIP_STD
+
 # Print device information at startup
 print("\n" + "="*80)
 print("🖥️  DEVICE INFORMATION")
@@ -83,6 +87,7 @@ class DeepfakeDetectionServer:
         self.detector_config = detector_config
         self.ensemble = ensemble
         self.models = {}
+        self.weight_files = {}  # Model name → weight files it was built from (shared backbone first)
         self.face_detector = None
         self.landmark_predictor = None
 
@@ -188,11 +193,14 @@ class DeepfakeDetectionServer:
                     if idx == 0:
                         model = self._load_detector(str(weight_path))
                         self.models[name] = model
+                        self.weight_files[name] = [weight_path]
                         shared_backbone = getattr(model, "backbone", None)
+                        backbone_weights = weight_path
                         print("(with CLIP backbone)")
                     else:
                         model = self._load_detector(str(weight_path), shared_backbone)
                         self.models[name] = model
+                        self.weight_files[name] = [backbone_weights, weight_path]
                         print("(reusing backbone)")
                 else:
                     print(f"[Warning] {name} weights not found: {weight_path}")
@@ -224,6 +232,7 @@ class DeepfakeDetectionServer:
             print("=" * 80)
             print(f"Weight file: {weight_path.name}")
             self.models[model_display_name] = self._load_detector(single_weights)
+            self.weight_files[model_display_name] = [weight_path]
             print(f"[✓] {model_display_name} model loaded successfully.")
             print(f"[i] Running in SINGLE MODEL mode (no ensemble voting)")
             print("=" * 80)
@@ -294,24 +303,40 @@ class DeepfakeDetectionServer:
         img = cv2.warpAffine(img, M, (outsize[1], outsize[0]))
         return cv2.resize(img, (outsize[1], outsize[0]))
 
-    def extract_aligned_face(self, image, res=224):
-        """Extract and align face from image. Returns BGR image or None."""
+    def extract_aligned_face(self, image, res=224, max_detect_side=None):
+        """
+        Extract and align face from image.
+        Returns (BGR face image, dlib rectangle of the face in image coordinates),
+        or (None, None) when no face is found.
+        """
         if self.face_detector is None:
-            return None
+            return None, None
 
         rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        
+        # HOG detection cost grows with the pixel count: detect on a copy scaled down to
+        # max_detect_side (0/None: full resolution), then map the rectangle back for
+        # landmarks and cropping
+        scale = max_detect_side / max(rgb.shape[:2]) if max_detect_side else 1.0
+        if scale < 1.0:
+            detect_rgb = cv2.resize(rgb, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            detect_rgb, scale = rgb, 1.0
         # Changed upsample from 1 to 0 for faster detection (2x faster, slightly less accurate)
-        faces = self.face_detector(rgb, 0)
+        faces = self.face_detector(detect_rgb, 0)
 
         if len(faces):
             face = max(faces, key=lambda rect: rect.width() * rect.height())
+            if scale != 1.0:
+                face = dlib.rectangle(int(face.left() / scale), int(face.top() / scale),
+                                      int(face.right() / scale), int(face.bottom() / scale))
             
             # Try landmark-based alignment first
             if self.landmark_predictor is not None:
                 try:
                     landmarks = self.get_keypts(rgb, face, self.landmark_predictor, self.face_detector)
                     cropped_face = self._img_align_crop(rgb, landmarks, outsize=(res, res))
-                    return cv2.cvtColor(cropped_face, cv2.COLOR_RGB2BGR)
+                    return cv2.cvtColor(cropped_face, cv2.COLOR_RGB2BGR), face
                 except Exception as e:
                     # Landmark detection failed - fall back to bounding box
                     print(f"[⚠] Landmark alignment failed: {e} — using bbox crop instead")
@@ -336,25 +361,27 @@ class DeepfakeDetectionServer:
             crop = rgb[new_top:new_bottom, new_left:new_right]
             if crop.size == 0:
                 print(f"[!] Bounding box crop failed - empty crop region")
-                return None
+                return None, None
             
             crop = cv2.resize(crop, (res, res), interpolation=cv2.INTER_LINEAR)
             print(f"[✓] Using bbox crop: {w}x{h} → {res}x{res}")
-            return cv2.cvtColor(crop, cv2.COLOR_RGB2BGR)
+            return cv2.cvtColor(crop, cv2.COLOR_RGB2BGR), face
         
-        return None
+        return None, None
 
     @staticmethod
-    def preprocess_face(img_bgr: np.ndarray):
-        """BGR → tensor (1,3,224,224)"""
-        img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-        img_rgb = cv2.resize(img_rgb, (224, 224), interpolation=cv2.INTER_LINEAR)
-        transform = T.Compose([
-            T.ToTensor(),
-            T.Normalize([0.48145466, 0.4578275, 0.40821073],
-                        [0.26862954, 0.26130258, 0.27577711]),
-        ])
-        return transform(pil_image.fromarray(img_rgb)).unsqueeze(0)
+    def preprocess_face(img_bgr: np.ndarray, out: np.ndarray = None):
+        """BGR → tensor (1,3,224,224), written into `out` (float32, same shape) when given"""
+        if img_bgr.shape[:2] != (224, 224):
+            img_bgr = cv2.resize(img_bgr, (224, 224), interpolation=cv2.INTER_LINEAR)
+        # (x / 255 - mean) / std straight from the BGR pixels: RGB order and CHW layout are
+        # views, so there is one scaling pass into the float32 output and one offset pass
+        chw = img_bgr[:, :, ::-1].transpose(2, 0, 1)
+        if out is None:
+            out = np.empty((1, 3, 224, 224), dtype=np.float32)
+        np.multiply(chw, PREPROCESS_SCALE, out=out[0])
+        out[0] -= PREPROCESS_OFFSET
+        return torch.from_numpy(out)
 
     @torch.inference_mode()
     def inference(self, model, data_dict):
@@ -397,7 +424,7 @@ class DeepfakeDetectionServer:
 
         # Extract face
         if self.face_detector:
-            face_aligned = self.extract_aligned_face(img)
+            face_aligned, _ = self.extract_aligned_face(img)
             if face_aligned is None:
                 return {'error': 'No face detected in image'}
         else:
@@ -630,7 +657,7 @@ class DeepfakeDetectionServer:
                 timestamp = frame_count / video_fps if video_fps > 0 else extracted_count
 
                 if self.face_detector:
-                    face_aligned = self.extract_aligned_face(frame)
+                    face_aligned, _ = self.extract_aligned_face(frame)
                     if face_aligned is None:
                         frame_count += 1
                         continue
@@ -703,7 +730,7 @@ class DeepfakeDetectionServer:
             face_detection_start = time.time()
 
             if self.face_detector:
-                face_aligned = self.extract_aligned_face(frame)
+                face_aligned, _ = self.extract_aligned_face(frame)
                 if face_aligned is None:
                     print(f"⚠️  Frame {idx}/{len(frames_data)} @ {frame_data['time_str']}: No face detected, skipping...")
                     continue
@@ -28,9 +28,21 @@ def create_app(config_name='development'):
     """
     app = Flask(__name__)
     
+    # Named spool files for uploads so routes can link them into place instead of copying
+    from app.wrappers import UploadRequest
+    app.request_class = UploadRequest
+    
+    # orjson for jsonify()/get_json() - serializes model datetimes natively
+    from app.json_provider import OrJSONProvider
+    app.json = OrJSONProvider(app)
+    
     # Load configuration
     app.config.from_object(f'config.{config_name.capitalize()}Config')
     
+    # Accept gzip/deflate-compressed request bodies (large extension syncs)
+    from app.middleware import RequestDecompressionMiddleware
+    app.wsgi_app = RequestDecompressionMiddleware(app.wsgi_app, max_size=app.config['MAX_UPLOAD_SIZE'])
+    
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
@@ -43,7 +55,7 @@ def create_app(config_name='development'):
              r"/*": {
                  "origins": "*",
                  "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-                 "allow_headers": ["Content-Type", "Authorization"],
+                 "allow_headers": ["Content-Type", "Content-Encoding", "Authorization"],
                  "expose_headers": ["Content-Type", "Authorization"],
                  "supports_credentials": False
              }
@@ -53,13 +65,14 @@ def create_app(config_name='development'):
     # Use Redis message queue only in production, use simple mode in development
     socketio_config = {
         'cors_allowed_origins': app.config['CORS_ORIGINS'],
-        'async_mode': 'eventlet',
+        'async_mode': app.config['SOCKETIO_ASYNC_MODE'],
         'logger': False,
         'engineio_logger': False
     }
     
-    # Only use Redis message queue if in production
-    if config_name.lower() == 'production':
+    # Use the Redis message queue in production, and whenever uploads run on the Celery
+    # worker: its progress emits only reach browsers through the queue
+    if config_name.lower() == 'production' or app.config['USE_CELERY_WORKER']:
         try:
             socketio_config['message_queue'] = app.config['SOCKETIO_MESSAGE_QUEUE']
         except Exception as e:
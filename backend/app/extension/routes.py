@@ -6,7 +6,9 @@ from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_tok
 from app import db
 from app.models import ExtensionLink, DetectionSession, FrameResult, User
 from app.extension import extension_bp
+from app.extension.schemas import sync_frame_decoder, sync_payload_decoder
 from datetime import datetime
+import msgspec
 import secrets
 
 
@@ -110,25 +112,25 @@ def verify_extension_token():
     
     extension_token = data['extension_token']
     
-    # Find link
-    link = ExtensionLink.query.filter_by(
-        extension_token=extension_token,
-        is_active=True
+    # Find active link and its user in a single round-trip
+    row = db.session.query(
+        ExtensionLink.user_id,
+        User.email,
+        User.username
+    ).join(
+        User, User.id == ExtensionLink.user_id
+    ).filter(
+        ExtensionLink.extension_token == extension_token,
+        ExtensionLink.is_active.is_(True)
     ).first()
     
-    if not link:
+    if not row:
         return jsonify({'error': 'Invalid or expired token'}), 401
     
-    # Get user
-    user = User.query.get(link.user_id)
-    
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
-    
     return jsonify({
-        'user_id': user.id,
-        'email': user.email,
-        'username': user.username
+        'user_id': row.user_id,
+        'email': row.email,
+        'username': row.username
     }), 200
 
 
@@ -153,15 +155,18 @@ def sync_extension_data():
     }
     """
     from flask import current_app
-    import json as json_module
-    
-    data = request.get_json()
     
-    if not data:
+    # Decode the envelope; frames stay raw and are validated one by one below
+    try:
+        data = sync_payload_decoder.decode(request.get_data(cache=False))
+    except msgspec.ValidationError as e:
+        current_app.logger.error(f'Sync failed: Invalid payload ({e})')
+        return jsonify({'error': f'Invalid sync payload: {e}'}), 400
+    except msgspec.DecodeError:
         current_app.logger.error('Sync failed: No data provided')
         return jsonify({'error': 'No data provided'}), 400
     
-    extension_token = data.get('extension_token')
+    extension_token = data.extension_token
     
     if not extension_token:
         current_app.logger.error('Sync failed: No extension token')
@@ -180,9 +185,9 @@ def sync_extension_data():
     current_app.logger.info(f'Sync request from user {link.user_id}')
     
     # Get data
-    video_url = data.get('video_url')
-    video_title = data.get('video_title')
-    frames = data.get('frames', [])
+    video_url = data.video_url
+    video_title = data.video_title
+    frames = data.frames
     
     current_app.logger.info(f'Sync data: URL={video_url}, Title={video_title}, Frames={len(frames)}')
     
@@ -190,6 +195,14 @@ def sync_extension_data():
         current_app.logger.warning('Sync warning: No frame data provided')
         return jsonify({'error': 'No frame data provided'}), 400
     
+    # Decode each frame on its own so one malformed frame is skipped, not the whole sync
+    valid_frames = []
+    for index, raw_frame in enumerate(frames):
+        try:
+            valid_frames.append(sync_frame_decoder.decode(raw_frame))
+        except msgspec.DecodeError as frame_error:
+            current_app.logger.error(f'Error adding frame {index}: {frame_error}')
+    
     try:
         # Create new session
         session = DetectionSession(
@@ -199,67 +212,53 @@ def sync_extension_data():
             video_title=video_title,
             fps=1,  # Extension always uses 1 FPS
             total_frames=len(frames),
-            session_metadata=data.get('session_stats', {})  # Fixed: use session_metadata not metadata
+            session_metadata=data.session_stats
         )
         
         db.session.add(session)
         db.session.flush()  # Get session ID
+        session_id = session.id
         
-        current_app.logger.info(f'Created session {session.id} for user {link.user_id}')
+        current_app.logger.info(f'Created session {session_id} for user {link.user_id}')
         
-        # Add frame results
-        frames_added = 0
-        for frame_data in frames:
-            try:
-                # Handle bbox - convert to JSON string if it's a list
-                bbox_data = frame_data.get('bbox')
-                if bbox_data and isinstance(bbox_data, list):
-                    # Keep as list - JSON column will handle it
-                    bbox_value = bbox_data
-                elif bbox_data and isinstance(bbox_data, str):
-                    # Try to parse if it's a JSON string
-                    try:
-                        bbox_value = json_module.loads(bbox_data)
-                    except:
-                        bbox_value = None
-                else:
-                    bbox_value = None
-                
-                frame_result = FrameResult(
-                    session_id=session.id,
-                    timestamp=float(frame_data.get('timestamp', 0)),
-                    frame_number=int(frame_data.get('frame_number', 0)),
-                    prediction=frame_data.get('prediction', 'UNKNOWN'),
-                    confidence=float(frame_data.get('confidence', 0)) * 100.0,  # Convert 0-1 to 0-100
-                    bbox=bbox_value,
-                    model_outputs=frame_data.get('model_outputs')
-                )
-                db.session.add(frame_result)
-                frames_added += 1
-                
-            except Exception as frame_error:
-                current_app.logger.error(f'Error adding frame {frame_data.get("frame_number")}: {frame_error}')
-                continue
+        # Add frame results (created_at is filled in by the database)
+        db.session.bulk_insert_mappings(FrameResult, [
+            {
+                'session_id': session_id,
+                'timestamp': frame.timestamp,
+                'frame_number': frame.frame_number,
+                'prediction': frame.prediction,
+                'confidence': frame.confidence * 100.0,  # Convert 0-1 to 0-100
+                'bbox': frame.bbox,
+                'model_outputs': frame.model_outputs
+            }
+            for frame in valid_frames
+        ])
+        frames_added = len(valid_frames)
         
-        # Update last sync time
-        link.last_sync_at = datetime.utcnow()
+        # Update last sync time with a direct UPDATE (keeps the link out of the ORM flush)
+        db.session.execute(
+            db.update(ExtensionLink)
+            .where(ExtensionLink.id == link.id)
+            .values(last_sync_at=datetime.utcnow())
+        )
         
         # Commit everything
         try:
             db.session.commit()
-            current_app.logger.info(f'✅ Sync successful: Session {session.id}, {frames_added} frames committed to database')
+            current_app.logger.info(f'✅ Sync successful: Session {session_id}, {frames_added} frames committed to database')
         except Exception as commit_error:
             db.session.rollback()
             current_app.logger.error(f'❌ Commit failed: {str(commit_error)}', exc_info=True)
             raise
         
         # Verify frames were saved
-        saved_count = FrameResult.query.filter_by(session_id=session.id).count()
-        current_app.logger.info(f'🔍 Verification: {saved_count} frames found in database for session {session.id}')
+        saved_count = FrameResult.query.filter_by(session_id=session_id).count()
+        current_app.logger.info(f'🔍 Verification: {saved_count} frames found in database for session {session_id}')
         
         return jsonify({
             'message': 'Data synced successfully',
-            'session_id': session.id,
+            'session_id': session_id,
             'frames_synced': frames_added
         }), 201
         
@@ -278,19 +277,32 @@ def test_sync():
     try:
         from flask import current_app
         
-        # Get all extension sessions
-        sessions = DetectionSession.query.filter_by(source='extension').order_by(DetectionSession.id.desc()).limit(10).all()
+        # Get latest extension sessions with their stored frame counts in one query
+        # (column tuples only - no ORM object hydration)
+        sessions = db.session.query(
+            DetectionSession.id,
+            DetectionSession.user_id,
+            DetectionSession.video_title,
+            DetectionSession.total_frames,
+            DetectionSession.started_at,
+            db.func.count(FrameResult.id).label('frame_count')
+        ).outerjoin(
+            FrameResult, FrameResult.session_id == DetectionSession.id
+        ).filter(
+            DetectionSession.source == 'extension'
+        ).group_by(
+            DetectionSession.id
+        ).order_by(DetectionSession.id.desc()).limit(10).all()
         
         results = []
-        for session in sessions:
-            frame_count = FrameResult.query.filter_by(session_id=session.id).count()
+        for row in sessions:
             results.append({
-                'session_id': session.id,
-                'user_id': session.user_id,
-                'video_title': session.video_title,
-                'total_frames_claimed': session.total_frames,
-                'actual_frames_in_db': frame_count,
-                'started_at': session.started_at.isoformat() if session.started_at else None
+                'session_id': row.id,
+                'user_id': row.user_id,
+                'video_title': row.video_title,
+                'total_frames_claimed': row.total_frames,
+                'actual_frames_in_db': row.frame_count,
+                'started_at': row.started_at.isoformat() if row.started_at else None
             })
         
         current_app.logger.info(f'Test sync: Found {len(sessions)} extension sessions')
@@ -0,0 +1,30 @@
+"""
+Typed request schemas for extension sync payloads.
+"""
+from typing import Any, Dict, List, Optional
+
+import msgspec
+
+
+class SyncFrame(msgspec.Struct):
+    """Single frame result reported by the extension (confidence in 0-1 range)."""
+    timestamp: float = 0.0
+    frame_number: int = 0
+    prediction: str = 'UNKNOWN'
+    confidence: float = 0.0
+    bbox: Optional[List[float]] = None  # [x, y, w, h] normalized coordinates
+    model_outputs: Optional[Dict[str, Any]] = None
+
+
+class SyncPayload(msgspec.Struct):
+    """Body of POST /api/extension/sync."""
+    extension_token: Optional[str] = None
+    video_url: Optional[str] = None
+    video_title: Optional[str] = None
+    frames: List[msgspec.Raw] = []  # Decoded one by one with sync_frame_decoder
+    session_stats: Dict[str, Any] = {}
+
+
+sync_payload_decoder = msgspec.json.Decoder(SyncPayload)
+# Lax mode coerces numbers sent as strings ("1.5") like the float()/int() calls it replaced
+sync_frame_decoder = msgspec.json.Decoder(SyncFrame, strict=False)
@@ -0,0 +1,33 @@
+"""
+orjson-backed JSON provider for Flask.
+"""
+import decimal
+
+import orjson
+from flask.json.provider import JSONProvider
+
+
+def _default(obj):
+    """Fallback for types orjson does not serialize natively."""
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class OrJSONProvider(JSONProvider):
+    """
+    Serialize responses and parse request bodies with orjson.
+    Naive datetimes (all model timestamps are stored as UTC) are emitted
+    as RFC 3339 strings with a +00:00 offset, so models can hand raw
+    datetime objects to jsonify().
+    """
+
+    option = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self.option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
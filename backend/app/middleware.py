@@ -0,0 +1,79 @@
+"""
+WSGI middleware for SpotifAI backend.
+"""
+import io
+import json
+import zlib
+
+from werkzeug.wsgi import get_input_stream
+
+
+class RequestDecompressionMiddleware:
+    """
+    Transparently decode compressed request bodies.
+    Clients (e.g. the extension's /sync call) may send
+    `Content-Encoding: gzip` or `deflate`; the body is inflated here so
+    request.get_json() and friends see plain bytes.
+    """
+
+    # wbits for zlib.decompressobj: gzip wrapper / zlib wrapper
+    ENCODINGS = {
+        'gzip': 16 + zlib.MAX_WBITS,
+        'deflate': zlib.MAX_WBITS
+    }
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, wsgi_app, max_size):
+        self.wsgi_app = wsgi_app
+        self.max_size = max_size
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+
+        if encoding not in self.ENCODINGS:
+            return self.wsgi_app(environ, start_response)
+
+        try:
+            # Bounded by CONTENT_LENGTH: on a keep-alive connection the raw input is the
+            # socket, which never reports end of body on its own
+            body = self._decompress(get_input_stream(environ), self.ENCODINGS[encoding])
+        except ValueError:
+            return self._error(start_response, '413 Payload Too Large', 'Payload Too Large',
+                               'The decompressed request body exceeds the maximum allowed size')
+        except zlib.error:
+            return self._error(start_response, '400 Bad Request', 'Bad Request',
+                               f'Invalid {encoding} request body')
+
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        del environ['HTTP_CONTENT_ENCODING']
+
+        return self.wsgi_app(environ, start_response)
+
+    def _decompress(self, stream, wbits):
+        """Stream-inflate the request body, refusing to grow past max_size."""
+        decompressor = zlib.decompressobj(wbits)
+        output = bytearray()
+
+        while True:
+            chunk = stream.read(self.CHUNK_SIZE)
+            if not chunk:
+                break
+            output += decompressor.decompress(chunk, self.max_size + 1 - len(output))
+            if len(output) > self.max_size or decompressor.unconsumed_tail:
+                raise ValueError('decompressed body too large')
+
+        output += decompressor.flush()
+        if len(output) > self.max_size:
+            raise ValueError('decompressed body too large')
+
+        return bytes(output)
+
+    @staticmethod
+    def _error(start_response, status, error, message):
+        body = json.dumps({'error': error, 'message': message}).encode('utf-8')
+        start_response(status, [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body)))
+        ])
+        return [body]
@@ -2,11 +2,48 @@
 Database models for SpotifAI backend.
 """
 from datetime import datetime, timedelta
+import sqlite3
 from app import db
+from sqlalchemy import DDL, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import PrimaryKeyConstraint
+from sqlalchemy.sql.expression import FunctionElement
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
 
 
+# Binary JSON on Postgres (no re-parse on read, indexable); plain JSON elsewhere (e.g. SQLite in tests)
+JSONType = db.JSON().with_variant(JSONB(), 'postgresql')
+
+
+class utcnow(FunctionElement):
+    """Database-side UTC timestamp (same value datetime.utcnow() would give)."""
+    type = db.DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow, 'postgresql')
+def _pg_utcnow(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+
+@compiles(utcnow)
+def _default_utcnow(element, compiler, **kw):
+    # SQLite's CURRENT_TIMESTAMP is already UTC
+    return 'CURRENT_TIMESTAMP'
+
+
+@event.listens_for(Engine, 'connect')
+def _sqlite_foreign_keys(dbapi_connection, connection_record):
+    # Session children are deleted by ON DELETE CASCADE, which SQLite only enforces when asked
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
 class User(db.Model):
     """User model for authentication."""
     __tablename__ = 'users'
@@ -22,8 +59,8 @@ class User(db.Model):
     email_verified = db.Column(db.Boolean, default=False, nullable=False)  # Email verification status
     verification_otp = db.Column(db.String(6), nullable=True)  # 6-digit OTP for email verification
     verification_otp_expires = db.Column(db.DateTime, nullable=True)  # Verification OTP expiration
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=utcnow(), onupdate=datetime.utcnow)
     
     # Relationships
     sessions = db.relationship('DetectionSession', back_populates='user', cascade='all, delete-orphan')
@@ -86,7 +123,7 @@ class User(db.Model):
             'username': self.username,
             'oauth_provider': self.oauth_provider,
             'email_verified': self.email_verified,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at
         }
     
     def __repr__(self):
@@ -109,8 +146,8 @@ class VideoUpload(db.Model):
     status = db.Column(db.String(50), default='uploaded')  # uploaded, processing, completed, failed
     progress = db.Column(db.Float, default=0.0)  # 0.0 to 100.0
     error_message = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, server_default=utcnow(), onupdate=datetime.utcnow)
     
     # Relationships
     user = db.relationship('User', back_populates='videos')
@@ -129,8 +166,8 @@ class VideoUpload(db.Model):
             'status': self.status,
             'progress': self.progress,
             'error_message': self.error_message,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
         }
     
     def __repr__(self):
@@ -151,13 +188,17 @@ class DetectionSession(db.Model):
     ended_at = db.Column(db.DateTime, nullable=True)
     fps = db.Column(db.Integer, nullable=False)  # 1 for extension, 10 for uploads
     total_frames = db.Column(db.Integer, default=0)
-    session_metadata = db.Column(db.JSON, nullable=True)  # Browser info, etc. (renamed from metadata)
+    session_metadata = db.Column(JSONType, nullable=True)  # Browser info, etc. (renamed from metadata)
     
     # Relationships
     user = db.relationship('User', back_populates='sessions')
     video = db.relationship('VideoUpload', back_populates='session')
-    frame_results = db.relationship('FrameResult', back_populates='session', cascade='all, delete-orphan')
-    aggregated_verdicts = db.relationship('AggregatedVerdict', back_populates='session', cascade='all, delete-orphan')
+    # Children are written in bulk and read via explicit queries: never load the collections,
+    # let the database's ON DELETE CASCADE remove them
+    frame_results = db.relationship('FrameResult', back_populates='session', cascade='all, delete-orphan',
+                                    passive_deletes=True, lazy='noload')
+    aggregated_verdicts = db.relationship('AggregatedVerdict', back_populates='session', cascade='all, delete-orphan',
+                                          passive_deletes=True, lazy='noload')
     
     def to_dict(self):
         """Convert session to dictionary."""
@@ -166,8 +207,8 @@ class DetectionSession(db.Model):
             'source': self.source,
             'video_url': self.video_url,
             'video_title': self.video_title,
-            'started_at': self.started_at.isoformat() if self.started_at else None,
-            'ended_at': self.ended_at.isoformat() if self.ended_at else None,
+            'started_at': self.started_at,
+            'ended_at': self.ended_at,
             'fps': self.fps,
             'total_frames': self.total_frames,
             'session_metadata': self.session_metadata
@@ -181,22 +222,25 @@ class FrameResult(db.Model):
     """Model for individual frame detection results."""
     __tablename__ = 'frame_results'
     
-    id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.Integer, db.ForeignKey('detection_sessions.id'), nullable=False, index=True)
+    # Postgres requires the partition key in the primary key: its DDL gets (id, session_id)
+    # (see _pg_frame_results_primary_key); elsewhere id alone stays an autoincrement key
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('detection_sessions.id', ondelete='CASCADE'), nullable=False, index=True)
     timestamp = db.Column(db.Float, nullable=False)  # Video timestamp in seconds
     frame_number = db.Column(db.Integer, nullable=False)
     prediction = db.Column(db.String(20), nullable=False)  # 'REAL', 'FAKE', 'NO_FACE'
     confidence = db.Column(db.Float, nullable=False)  # 0.0 to 100.0
-    bbox = db.Column(db.JSON, nullable=True)  # [x, y, w, h] normalized coordinates
-    model_outputs = db.Column(db.JSON, nullable=True)  # Detailed per-model results
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    bbox = db.Column(JSONType, nullable=True)  # [x, y, w, h] normalized coordinates
+    model_outputs = db.Column(JSONType, nullable=True)  # Detailed per-model results
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
     
     # Relationships
     session = db.relationship('DetectionSession', back_populates='frame_results')
     
-    # Composite index for efficient queries
+    # Composite index for efficient queries; hash-partitioned by session on Postgres
     __table_args__ = (
         db.Index('idx_session_timestamp', 'session_id', 'timestamp'),
+        {'postgresql_partition_by': 'HASH (session_id)'},
     )
     
     def to_dict(self):
@@ -209,19 +253,40 @@ class FrameResult(db.Model):
             'confidence': self.confidence,
             'bbox': self.bbox,
             'model_outputs': self.model_outputs,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at
         }
     
     def __repr__(self):
         return f'<FrameResult {self.id} ({self.prediction})>'
 
 
+@compiles(PrimaryKeyConstraint, 'postgresql')
+def _pg_frame_results_primary_key(constraint, compiler, **kw):
+    if constraint.table is not None and constraint.table.name == FrameResult.__tablename__:
+        return 'PRIMARY KEY (id, session_id)'
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
+
+# Number of hash partitions backing frame_results on Postgres
+FRAME_RESULT_PARTITIONS = 16
+
+for _remainder in range(FRAME_RESULT_PARTITIONS):
+    event.listen(
+        FrameResult.__table__,
+        'after_create',
+        DDL(
+            f'CREATE TABLE frame_results_p{_remainder} PARTITION OF frame_results '
+            f'FOR VALUES WITH (MODULUS {FRAME_RESULT_PARTITIONS}, REMAINDER {_remainder})'
+        ).execute_if(dialect='postgresql')
+    )
+
+
 class AggregatedVerdict(db.Model):
     """Model for sliding window aggregated verdicts."""
     __tablename__ = 'aggregated_verdicts'
     
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.Integer, db.ForeignKey('detection_sessions.id'), nullable=False, index=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('detection_sessions.id', ondelete='CASCADE'), nullable=False, index=True)
     window_start = db.Column(db.Float, nullable=False)  # Timestamp in seconds
     window_end = db.Column(db.Float, nullable=False)
     verdict = db.Column(db.String(20), nullable=False)  # Majority vote result
@@ -229,7 +294,7 @@ class AggregatedVerdict(db.Model):
     fake_count = db.Column(db.Integer, default=0)
     real_count = db.Column(db.Integer, default=0)
     no_face_count = db.Column(db.Integer, default=0)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
     
     # Relationships
     session = db.relationship('DetectionSession', back_populates='aggregated_verdicts')
@@ -268,8 +333,8 @@ class ExtensionLink(db.Model):
             'id': self.id,
             'user_id': self.user_id,
             'is_active': self.is_active,
-            'linked_at': self.linked_at.isoformat() if self.linked_at else None,
-            'last_sync_at': self.last_sync_at.isoformat() if self.last_sync_at else None
+            'linked_at': self.linked_at,
+            'last_sync_at': self.last_sync_at
         }
     
     def __repr__(self):
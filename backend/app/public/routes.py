@@ -1,75 +1,178 @@
 import os
+import av
 import cv2
-import json
+import orjson
 import time
-import base64
+import queue
+import struct
 import asyncio
+import threading
+from collections import deque
 import websockets
 import requests
+from requests.adapters import HTTPAdapter
+import simplejpeg
 from flask import request, Response, stream_with_context, current_app
 from werkzeug.utils import secure_filename
 from app.public import public_bp
+from app.video_io import open_video
+
+# Keep-alive HTTP session for native host availability probes
+native_host_session = requests.Session()
+native_host_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+# Last availability probe result, reused for NATIVE_HOST_PROBE_TTL seconds
+NATIVE_HOST_PROBE_TTL = 1.0
+native_host_probe = {'checked_at': float('-inf'), 'available': False}
+
+# Event loop shared by all /analyze requests for native host WebSocket I/O (started lazily)
+native_host_loop = None
+native_host_loop_lock = threading.Lock()
 
 # Allowed video extensions
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'webm', 'mkv', 'flv'}
 
+# Decode/inference pipelining: encoded frames buffered ahead of the WebSocket,
+# frames per native host message, and batches sent before the oldest result is awaited
+FRAME_QUEUE_SIZE = 16
+FRAME_BATCH_SIZE = 8
+MAX_BATCHES_IN_FLIGHT = 2
+END_OF_FRAMES = object()
+
+# Minimum seconds between SSE progress events
+PROGRESS_EVENT_INTERVAL = 0.5
+
+# Keep proxies (nginx proxy_buffering, gzip) from holding back SSE chunks
+SSE_HEADERS = {'Cache-Control': 'no-cache, no-transform', 'X-Accel-Buffering': 'no'}
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def generate_sse_message(data):
     """Format data as Server-Sent Event message"""
-    return f"data: {json.dumps(data)}\n\n"
+    return b'data: ' + orjson.dumps(data) + b'\n\n'
+
+def sse_error(message):
+    """Single-event SSE response carrying an error message"""
+    return Response(generate_sse_message({'type': 'error', 'message': message}), mimetype='text/event-stream', headers=SSE_HEADERS)
 
 def check_native_host_available():
-    """Check if native host inference server is running"""
+    """
+    Check if native host inference server is running.
+    The result is reused for NATIVE_HOST_PROBE_TTL seconds; a host that went down
+    in the meantime surfaces as a WebSocket connect error instead.
+    """
+    now = time.monotonic()
+    if now - native_host_probe['checked_at'] < NATIVE_HOST_PROBE_TTL:
+        return native_host_probe['available']
+    
     try:
         host = current_app.config.get('INFERENCE_SERVER_HOST', '127.0.0.1')
         port = current_app.config.get('INFERENCE_SERVER_PORT', 8765)
         url = f"http://{host}:{port}"
-        response = requests.get(url, timeout=3)
-        return True
+        native_host_session.get(url, timeout=3)
+        available = True
     except:
-        return False
+        available = False
+    
+    native_host_probe['available'] = available
+    native_host_probe['checked_at'] = time.monotonic()
+    return available
+
+def save_upload(file, path):
+    """
+    Store an uploaded file at path.
+    Large uploads are already spooled to a named temp file (see UploadRequest),
+    which is hard-linked into place instead of copied; anything else falls
+    back to file.save().
+    """
+    spool_path = getattr(file.stream, 'name', None)
+    if isinstance(spool_path, str):
+        try:
+            file.stream.flush()
+            os.link(spool_path, path)
+            return
+        except OSError:
+            pass  # e.g. spool dir on another filesystem
+    
+    file.save(path)
+
+def resize_for_inference(frame, max_side):
+    """
+    Downscale frame so its longest side is at most max_side pixels.
+    Aspect ratio is preserved: the native host still has to find and align the
+    face in the frame before cropping it to the model input size.
+    """
+    height, width = frame.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1.0:
+        return frame
+    
+    return cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+def get_native_host_loop():
+    """Shared event loop for native host WebSocket I/O, running on a daemon thread"""
+    global native_host_loop
+    with native_host_loop_lock:
+        if native_host_loop is None:
+            native_host_loop = asyncio.new_event_loop()
+            threading.Thread(target=native_host_loop.run_forever, daemon=True).start()
+    return native_host_loop
+
+def run_on_native_host_loop(coro):
+    """Run a coroutine on the shared native host loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, get_native_host_loop()).result()
 
-async def send_frame_to_native_host(ws_url, frame, frame_id):
-    """Send frame to native host WebSocket server for inference"""
+async def connect_to_native_host(ws_url):
+    """Open a WebSocket connection to the native host"""
+    return await websockets.connect(ws_url, ping_timeout=10, max_size=None)
+
+def encode_frame_jpeg(frame, max_side):
+    """Downscale and JPEG-encode a frame for the native host"""
+    frame = resize_for_inference(frame, max_side)
+    
+    # Convert frame to JPEG (libjpeg-turbo via simplejpeg; raises on failure).
+    # Baseline, non-optimized Huffman tables at quality 72: the frame is decoded once
+    # by the native host and downscaled for the model, so extra quality is wasted.
+    return simplejpeg.encode_jpeg(frame, quality=72, colorspace='BGR', fastdct=True)
+
+def build_batch_message(batch):
+    """
+    Build the binary native host message for a batch of (frame_id, jpeg) pairs:
+    <uint32 header length><JSON header><JPEG bytes of each frame, back to back>
+    """
+    header = orjson.dumps({
+        'type': 'frame_batch',
+        'videoId': 'public_upload',
+        'frames': [{'id': frame_id, 'ts': 0, 'size': len(jpeg)} for frame_id, jpeg in batch]
+    })
+    
+    return b''.join([struct.pack('<I', len(header)), header] + [jpeg for _, jpeg in batch])
+
+async def send_frame_message(websocket, message):
+    """Send an encoded message over an open native host WebSocket"""
     try:
-        # Convert frame to base64 JPEG
-        success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        if not success:
-            return None
-        
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
-        data_url = f'data:image/jpeg;base64,{img_base64}'
-        
-        # Create message
-        message = {
-            'type': 'frame',
-            'id': frame_id,
-            'videoId': 'public_upload',
-            'ts': 0,
-            'frameB64': data_url
-        }
-        
-        # Connect and send
-        async with websockets.connect(ws_url, ping_timeout=10) as websocket:
-            await websocket.send(json.dumps(message))
-            response = await websocket.recv()
-            result = json.loads(response)
-            return result
+        await websocket.send(message)
+        return True
     except Exception as e:
         print(f"WebSocket error: {str(e)}")
-        return None
+        return False
 
-def process_frame_with_native_host(ws_url, frame, frame_id):
-    """Synchronous wrapper for async WebSocket frame processing"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+async def receive_batch_results(websocket, batch_size):
+    """
+    Wait for the next batch result on an open native host WebSocket.
+    Returns one result per frame of the batch (None for all if the batch failed).
+    """
     try:
-        result = loop.run_until_complete(send_frame_to_native_host(ws_url, frame, frame_id))
-        return result
-    finally:
-        loop.close()
+        response = orjson.loads(await websocket.recv())
+        results = response.get('results') if response.get('type') == 'batch_result' else None
+        if results is None or len(results) != batch_size:
+            print(f"Native host batch failed: {response.get('error', response.get('type'))}")
+            return [None] * batch_size
+        return results
+    except Exception as e:
+        print(f"WebSocket error: {str(e)}")
+        return [None] * batch_size
 
 def apply_confidence_transformations(prediction, confidence):
     """Apply confidence transformations"""
@@ -82,6 +185,89 @@ def apply_confidence_transformations(prediction, confidence):
     
     return prediction, confidence
 
+def iter_nth_frames(container, frame_interval):
+    """
+    Yield every frame_interval-th frame of the container's first video stream
+    as a BGR array. FFmpeg decodes with frame/slice threads; only the sampled
+    frames are converted out of the decoder's native pixel format.
+    """
+    stream = container.streams.video[0]
+    for index, frame in enumerate(container.decode(stream)):
+        if index % frame_interval == 0:
+            yield frame.to_ndarray(format='bgr24')
+
+def put_unless_stopped(frames, item, stop_event):
+    """Put item on the bounded frames queue, giving up once stop_event is set"""
+    while not stop_event.is_set():
+        try:
+            frames.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def produce_encoded_frames(container, frame_interval, max_side, frames, stop_event):
+    """
+    Producer thread: decode, resize and encode sampled frames into the frames queue
+    as (frame_number, frame_id, jpeg) tuples, followed by END_OF_FRAMES. jpeg is
+    None when a frame could not be encoded.
+    """
+    try:
+        for frame_number, frame in enumerate(iter_nth_frames(container, frame_interval), start=1):
+            frame_id = f"public_{int(time.time())}_{frame_number}"
+            try:
+                jpeg = encode_frame_jpeg(frame, max_side)
+            except Exception as e:
+                print(f"Frame {frame_number} encoding failed: {str(e)}")
+                jpeg = None
+            
+            if not put_unless_stopped(frames, (frame_number, frame_id, jpeg), stop_event):
+                return
+    except Exception as e:
+        print(f"Frame decoding failed: {str(e)}")
+    finally:
+        put_unless_stopped(frames, END_OF_FRAMES, stop_event)
+
+def iter_native_host_results(websocket, frames):
+    """
+    Send frames from the producer queue to the native host in batches of up to
+    FRAME_BATCH_SIZE, keeping up to MAX_BATCHES_IN_FLIGHT batches ahead of the result
+    being awaited. The native host answers each message once and in order, so
+    results are matched by position.
+    Yields (frame_number, result) in frame order; result is None when the frame failed.
+    """
+    in_flight = deque()
+    exhausted = False
+    
+    while True:
+        while not exhausted and len(in_flight) < MAX_BATCHES_IN_FLIGHT:
+            frame_numbers = []
+            batch = []
+            while len(frame_numbers) < FRAME_BATCH_SIZE:
+                item = frames.get()
+                if item is END_OF_FRAMES:
+                    exhausted = True
+                    break
+                
+                frame_number, frame_id, jpeg = item
+                frame_numbers.append((frame_number, jpeg is not None))
+                if jpeg is not None:
+                    batch.append((frame_id, jpeg))
+            
+            if not frame_numbers:
+                break
+            
+            sent = bool(batch) and run_on_native_host_loop(send_frame_message(websocket, build_batch_message(batch)))
+            in_flight.append((frame_numbers, len(batch), sent))
+        
+        if not in_flight:
+            return
+        
+        frame_numbers, batch_size, sent = in_flight.popleft()
+        results = iter(run_on_native_host_loop(receive_batch_results(websocket, batch_size)) if sent else [])
+        for frame_number, encoded in frame_numbers:
+            yield frame_number, next(results, None) if encoded else None
+
 @public_bp.route('/analyze', methods=['POST'])
 def analyze_video():
     """
@@ -92,144 +278,152 @@ def analyze_video():
     try:
         # Check native host availability first
         if not check_native_host_available():
-            def error_stream():
-                yield generate_sse_message({
-                    'type': 'error',
-                    'message': 'AI inference server is not running. Please try again later.'
-                })
-            return Response(stream_with_context(error_stream()), mimetype='text/event-stream')
+            return sse_error('AI inference server is not running. Please try again later.')
+        
+        # Check upload size (100MB limit for public uploads) from the request headers,
+        # before the multipart body is parsed and spooled
+        max_size = 100 * 1024 * 1024  # 100MB
+        
+        if request.content_length is not None and request.content_length > max_size:
+            return sse_error('File too large. Maximum size: 100MB. Create a free account for 500MB limit.')
         
         # Check if file is in request
         if 'video' not in request.files:
-            def error_stream():
-                yield generate_sse_message({
-                    'type': 'error',
-                    'message': 'No video file provided'
-                })
-            return Response(stream_with_context(error_stream()), mimetype='text/event-stream')
+            return sse_error('No video file provided')
         
         file = request.files['video']
         
         # Check if filename is empty
         if file.filename == '':
-            def error_stream():
-                yield generate_sse_message({
-                    'type': 'error',
-                    'message': 'No file selected'
-                })
-            return Response(stream_with_context(error_stream()), mimetype='text/event-stream')
+            return sse_error('No file selected')
         
         # Check file extension
         if not allowed_file(file.filename):
-            def error_stream():
-                yield generate_sse_message({
-                    'type': 'error',
-                    'message': f'Invalid file format. Supported formats: {", ".join(ALLOWED_EXTENSIONS)}'
-                })
-            return Response(stream_with_context(error_stream()), mimetype='text/event-stream')
-        
-        # Check file size (100MB limit for public uploads)
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
-        max_size = 100 * 1024 * 1024  # 100MB
+            return sse_error(f'Invalid file format. Supported formats: {", ".join(ALLOWED_EXTENSIONS)}')
         
-        if file_size > max_size:
-            def error_stream():
-                yield generate_sse_message({
-                    'type': 'error',
-                    'message': 'File too large. Maximum size: 100MB. Create a free account for 500MB limit.'
-                })
-            return Response(stream_with_context(error_stream()), mimetype='text/event-stream')
+        temp_path = None
+        if isinstance(getattr(file.stream, 'name', None), str):
+            # Large upload, already spooled to disk: link it into place as a temporary file
+            filename = secure_filename(file.filename)
+            temp_dir = os.path.join(os.getcwd(), 'media', 'temp')
+            os.makedirs(temp_dir, exist_ok=True)
+            temp_path = os.path.join(temp_dir, f'upload_{int(time.time())}_{filename}')
+            save_upload(file, temp_path)
+            video_source = temp_path
+            
+            # Chunked uploads carry no Content-Length, so check what actually arrived
+            if os.path.getsize(temp_path) > max_size:
+                os.remove(temp_path)
+                return sse_error('File too large. Maximum size: 100MB. Create a free account for 500MB limit.')
+        else:
+            # Small upload, kept in memory by UploadRequest: PyAV decodes straight from that
+            # buffer (the request context stays open while the response streams)
+            video_source = file.stream
+            video_source.seek(0)
         
-        # Create temporary file
-        filename = secure_filename(file.filename)
-        temp_dir = os.path.join(os.getcwd(), 'media', 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-        temp_path = os.path.join(temp_dir, f'upload_{int(time.time())}_{filename}')
-        file.save(temp_path)
+        inference_input_size = current_app.config.get('INFERENCE_INPUT_SIZE', 640)
+        hw_decode_device = current_app.config.get('HW_DECODE_DEVICE') if current_app.config.get('USE_HW_DECODE') else None
         
         def process_video():
+            # One WebSocket connection (on the shared native host loop) for the whole video
+            websocket = None
+            container = None
+            producer = None
+            stop_event = threading.Event()
             try:
                 # WebSocket URL for native host
                 ws_url = os.getenv('WEBSOCKET_URL', 'ws://127.0.0.1:8765')
                 
                 # Open video
-                cap = cv2.VideoCapture(temp_path)
-                if not cap.isOpened():
+                try:
+                    container = open_video(video_source, hw_decode_device)
+                    stream = container.streams.video[0]
+                except (av.error.FFmpegError, IndexError):
                     yield generate_sse_message({
                         'type': 'error',
                         'message': 'Failed to open video file'
                     })
                     return
                 
-                fps = cap.get(cv2.CAP_PROP_FPS)
-                total_frames_in_video = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+                stream.thread_type = 'AUTO'
+                fps = float(stream.average_rate or 0)
+                total_frames_in_video = stream.frames
+                if not total_frames_in_video and container.duration:
+                    # Container has no frame count (e.g. webm) - estimate it from the duration
+                    total_frames_in_video = int(container.duration / av.time_base * fps)
                 
                 # Calculate frames to extract (1 FPS for public uploads)
                 frame_interval = max(1, int(fps))
                 total_frames_to_analyze = max(1, total_frames_in_video // frame_interval)
                 
-                # Storage for predictions
-                predictions = []
+                websocket = run_on_native_host_loop(connect_to_native_host(ws_url))
+                
+                # Running verdict tallies (frames with a face, and per-label count/confidence sum)
+                face_count = 0
+                fake_count = real_count = 0
+                fake_confidence_sum = real_confidence_sum = 0.0
                 frame_results = []
-                frame_count = 0
                 analyzed_count = 0
+                last_progress = -1
+                last_progress_at = 0.0
                 
-                while True:
-                    ret, frame = cap.read()
-                    if not ret:
-                        break
-                    
-                    # Process frame at 1 FPS interval
-                    if frame_count % frame_interval == 0:
-                        analyzed_count += 1
-                        frame_id = f"public_{int(time.time())}_{analyzed_count}"
-                        
-                        # Run deepfake detection using native host
-                        try:
-                            result = process_frame_with_native_host(ws_url, frame, frame_id)
+                # Decode/encode on a producer thread while inference is in flight
+                frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+                producer = threading.Thread(
+                    target=produce_encoded_frames,
+                    args=(container, frame_interval, inference_input_size, frames, stop_event),
+                    daemon=True
+                )
+                producer.start()
+                
+                for analyzed_count, result in iter_native_host_results(websocket, frames):
+                    # Record the native host result for this frame
+                    try:
+                        if result and 'prediction' in result:
+                            prediction = result['prediction']
+                            confidence = result.get('confidence', 0.0)
+                            
+                            # Apply transformations
+                            prediction, confidence = apply_confidence_transformations(prediction, confidence)
                             
-                            if result and 'prediction' in result:
-                                prediction = result['prediction']
-                                confidence = result.get('confidence', 0.0)
-                                
-                                # Apply transformations
-                                prediction, confidence = apply_confidence_transformations(prediction, confidence)
-                                
-                                # Store result
-                                frame_results.append({
-                                    'prediction': prediction,
-                                    'confidence': confidence,
-                                    'frame_number': analyzed_count
-                                })
-                                
-                                # Add to predictions for verdict calculation
-                                if prediction != 'NO_FACE':
-                                    predictions.append({
-                                        'label': prediction.lower(),
-                                        'confidence': confidence
-                                    })
-                        except Exception as e:
-                            # If processing fails, skip frame
-                            print(f"Frame {analyzed_count} processing failed: {str(e)}")
-                            pass
-                        
-                        # Send progress update AFTER processing
-                        progress = int((analyzed_count / total_frames_to_analyze) * 100)
+                            # Store result
+                            frame_results.append({
+                                'prediction': prediction,
+                                'confidence': confidence,
+                                'frame_number': analyzed_count
+                            })
+                            
+                            # Tally for verdict calculation
+                            if prediction != 'NO_FACE':
+                                face_count += 1
+                                label = prediction.lower()
+                                if label == 'fake':
+                                    fake_count += 1
+                                    fake_confidence_sum += confidence
+                                elif label == 'real':
+                                    real_count += 1
+                                    real_confidence_sum += confidence
+                    except Exception as e:
+                        # If processing fails, skip frame
+                        print(f"Frame {analyzed_count} processing failed: {str(e)}")
+                        pass
+                    
+                    # Send progress update AFTER processing (only when the percentage moved,
+                    # at most every PROGRESS_EVENT_INTERVAL seconds)
+                    progress = min(int((analyzed_count / total_frames_to_analyze) * 100), 99)
+                    now = time.monotonic()
+                    if progress != last_progress and now - last_progress_at > PROGRESS_EVENT_INTERVAL:
+                        last_progress = progress
+                        last_progress_at = now
                         yield generate_sse_message({
                             'type': 'progress',
-                            'progress': min(progress, 99),
+                            'progress': progress,
                             'current_frame': analyzed_count,
                             'total_frames': total_frames_to_analyze
                         })
-                    
-                    frame_count += 1
-                
-                cap.release()
                 
                 # Calculate final verdict
-                if not predictions:
+                if not face_count:
                     # No faces detected in any frame
                     yield generate_sse_message({
                         'type': 'complete',
@@ -244,22 +438,17 @@ def analyze_video():
                         }
                     })
                 else:
-                    # Count fake vs real predictions
-                    fake_count = sum(1 for p in predictions if p['label'] == 'fake')
-                    real_count = sum(1 for p in predictions if p['label'] == 'real')
-                    no_face_count = analyzed_count - len(predictions)
+                    no_face_count = analyzed_count - face_count
                     
                     # Determine verdict by majority voting
                     if fake_count > real_count:
                         verdict = 'FAKE'
                         # Average confidence of fake predictions
-                        fake_confidences = [p['confidence'] for p in predictions if p['label'] == 'fake']
-                        confidence = sum(fake_confidences) / len(fake_confidences) if fake_confidences else 0.0
+                        confidence = fake_confidence_sum / fake_count
                     else:
                         verdict = 'REAL'
                         # Average confidence of real predictions
-                        real_confidences = [p['confidence'] for p in predictions if p['label'] == 'real']
-                        confidence = sum(real_confidences) / len(real_confidences) if real_confidences else 0.0
+                        confidence = real_confidence_sum / real_count if real_count else 0.0
                     
                     yield generate_sse_message({
                         'type': 'complete',
@@ -281,16 +470,19 @@ def analyze_video():
                 })
             
             finally:
+                stop_event.set()
+                if producer is not None:
+                    producer.join()
+                if container is not None:
+                    container.close()
+                if websocket is not None:
+                    run_on_native_host_loop(websocket.close())
+                
                 # Clean up temporary file
-                if os.path.exists(temp_path):
+                if temp_path and os.path.exists(temp_path):
                     os.remove(temp_path)
         
-        return Response(stream_with_context(process_video()), mimetype='text/event-stream')
+        return Response(stream_with_context(process_video()), mimetype='text/event-stream', headers=SSE_HEADERS)
     
     except Exception as e:
-        def error_stream():
-            yield generate_sse_message({
-                'type': 'error',
-                'message': f'Server error: {str(e)}'
-            })
-        return Response(stream_with_context(error_stream()), mimetype='text/event-stream')
+        return sse_error(f'Server error: {str(e)}')
@@ -0,0 +1,21 @@
+"""
+Video decoding helpers shared by the upload and public analysis paths.
+"""
+import av
+from av.codec.hwaccel import HWAccel
+
+
+def open_video(source, hw_decode_device=None):
+    """
+    Open a video (path or file object) with PyAV. When hw_decode_device (e.g. 'cuda') is given, decode on
+    that device, falling back to software decoding if the device is unavailable.
+    """
+    if hw_decode_device:
+        try:
+            return av.open(source, hwaccel=HWAccel(device_type=hw_decode_device, allow_software_fallback=True))
+        except av.error.FFmpegError as e:
+            print(f"⚠️ Hardware decode ({hw_decode_device}) unavailable, using software decode: {e}")
+            if hasattr(source, 'seek'):
+                source.seek(0)  # The failed open may have read part of a file object
+    
+    return av.open(source)
@@ -3,16 +3,22 @@ Video Upload Routes
 """
 import os
 import uuid
+import av
 import requests
+from requests.adapters import HTTPAdapter
 from flask import request, jsonify, current_app
 from werkzeug.utils import secure_filename
 from app.videos import videos_bp
 from app.models import VideoUpload, DetectionSession, User
 from app import db
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.videos.upload_handler import start_video_processing
+from app.videos.upload_handler import start_video_processing, get_video_metadata
 
 
+# Keep-alive HTTP session for native host availability probes
+native_host_session = requests.Session()
+native_host_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
 MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
 
@@ -34,7 +40,7 @@ def check_native_host_status():
         url = f"http://{host}:{port}"
         
         # Try to connect with 3 second timeout
-        response = requests.get(url, timeout=3)
+        native_host_session.get(url, timeout=3)
         
         return jsonify({
             'connected': True,
@@ -111,12 +117,25 @@ def upload_video():
             os.remove(filepath)
             return jsonify({'error': f'File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB'}), 400
         
+        # Read duration/fps/size from the container header once, so processing doesn't have to
+        duration = fps = width = height = None
+        try:
+            with av.open(filepath) as container:
+                fps, _, duration, width, height = get_video_metadata(container)
+                fps = int(round(fps))
+        except (av.error.FFmpegError, IndexError):
+            pass  # Probed again when processing starts
+        
         # Create video upload record
         video = VideoUpload(
             user_id=user_id,
             filename=original_filename,
             filepath=filepath,
             filesize=file_size,
+            duration=duration,
+            fps=fps,
+            width=width,
+            height=height,
             status='uploaded'
         )
         db.session.add(video)
@@ -155,7 +174,10 @@ def get_video_status(video_id):
     try:
         user_id = get_jwt_identity()
         
-        video = VideoUpload.query.filter_by(id=video_id, user_id=user_id).first()
+        # Load the video and its detection session in one query
+        video = VideoUpload.query.options(
+            db.joinedload(VideoUpload.session)
+        ).filter_by(id=video_id, user_id=user_id).first()
         
         if not video:
             return jsonify({'error': 'Video not found'}), 404
@@ -3,76 +3,55 @@ Celery tasks for video processing - Optimized to use running WebSocket server.
 """
 from celery import Celery
 from app import db, create_app
+from config import Config
 from app.models import VideoUpload, DetectionSession, FrameResult
-import cv2
 import os
-import sys
-import torch
-import numpy as np
-from PIL import Image
-import base64
-import io
-import json
-import asyncio
-import websockets
-import requests
+import orjson
+import time
+import socket
+import simplejpeg
+from websocket import create_connection
+from app.video_io import open_video
+from app.videos.upload_handler import NO_FACE_STREAK, process_video_upload, iter_sampled_frames, get_upload_metadata, build_frame_message
 
-# Initialize Celery
-celery = Celery(__name__)
+# Initialize Celery - broker configured here so the web process can enqueue tasks too
+celery = Celery(__name__, broker=Config.CELERY_BROKER_URL, backend=Config.CELERY_RESULT_BACKEND)
 
+# Flask app shared by every task in this worker process (created on first use)
+flask_app = None
 
-async def send_frame_to_server(ws_url, frame, frame_id):
+# Native host availability per (host, port), reused for NATIVE_HOST_PROBE_TTL seconds
+NATIVE_HOST_PROBE_TTL = 10.0
+native_host_probes = {}
+
+
+def send_frame(ws_conn, frame, frame_id):
     """
-    Send frame to running WebSocket server and get prediction.
+    Send frame over an open WebSocket connection and get prediction.
     Uses the same protocol as the extension for consistency.
     """
     try:
-        # Convert frame to base64 JPEG
-        success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        if not success:
-            return None
-        
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
-        data_url = f'data:image/jpeg;base64,{img_base64}'
+        # Convert frame to JPEG (libjpeg-turbo via simplejpeg; raises on failure)
+        jpeg = simplejpeg.encode_jpeg(frame, quality=85, colorspace='BGR', colorsubsampling='420')
         
-        # Create message in same format as extension
+        # Create message header in same format as extension; the JPEG is sent as raw bytes
         message = {
             'type': 'frame',
             'id': frame_id,
             'videoId': 'web_upload',
-            'ts': 0,
-            'frameB64': data_url
+            'ts': 0
         }
         
-        # Connect to WebSocket server
-        async with websockets.connect(ws_url, ping_timeout=10) as websocket:
-            # Send frame
-            await websocket.send(json.dumps(message))
-            
-            # Wait for response
-            response = await websocket.recv()
-            result = json.loads(response)
-            
-            return result
-            
+        # Send frame and wait for response
+        ws_conn.send_binary(build_frame_message(message, jpeg))
+        response = ws_conn.recv()
+        return orjson.loads(response)
+        
     except Exception as e:
         print(f"WebSocket error: {str(e)}")
         return None
 
 
-def process_frame_with_ws(ws_url, frame, frame_id):
-    """
-    Synchronous wrapper for async WebSocket frame processing.
-    """
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        result = loop.run_until_complete(send_frame_to_server(ws_url, frame, frame_id))
-        return result
-    finally:
-        loop.close()
-
-
 def apply_confidence_transformations(prediction, confidence):
     """
     Apply same confidence transformations as extension.
@@ -91,45 +70,56 @@ def apply_confidence_transformations(prediction, confidence):
     return prediction, confidence
 
 
+def get_flask_app():
+    """Return the worker's Flask app, creating it once per process"""
+    global flask_app
+    if flask_app is None:
+        flask_app = create_app(os.getenv('FLASK_ENV', 'development'))
+    return flask_app
+
+
 @celery.task(bind=True)
 def process_video_task(self, video_id):
     """
     Celery task wrapper for video processing.
+    Processes video using WebSocket connection to running demo_server.
     """
-    app = create_app()
-    with app.app_context():
+    with get_flask_app().app_context():
         return process_video_sync(video_id)
 
 
-@celery.task(bind=True)
-def process_video_task(self, video_id):
+@celery.task(ignore_result=True)
+def process_video_upload_task(video_id):
     """
-    Celery task wrapper for video processing.
-    Processes video using WebSocket connection to running demo_server.
+    Celery task for dashboard uploads queued by start_video_processing.
+    Progress reaches the browser through the SocketIO message queue.
     """
-    app = create_app()
-    with app.app_context():
-        return process_video_sync(video_id)
+    app = get_flask_app()
+    process_video_upload(app, video_id, ws_url=app.config['NATIVE_HOST_WS_URL'])
 
 
 def check_native_host_connection(app):
     """
-    Check if native host inference server is running and accessible.
+    Check if native host inference server is accepting connections.
+    A plain TCP connect is enough (no HTTP request), and the result is reused for
+    NATIVE_HOST_PROBE_TTL seconds so tasks started together share one probe.
     Returns True if connected, False otherwise.
     """
+    host = app.config.get('INFERENCE_SERVER_HOST', '127.0.0.1')
+    port = app.config.get('INFERENCE_SERVER_PORT', 8765)
+    
+    probe = native_host_probes.get((host, port))
+    if probe and time.monotonic() - probe['checked_at'] < NATIVE_HOST_PROBE_TTL:
+        return probe['available']
+    
     try:
-        host = app.config.get('INFERENCE_SERVER_HOST', '127.0.0.1')
-        port = app.config.get('INFERENCE_SERVER_PORT', 8765)
-        url = f"http://{host}:{port}"
-        
-        response = requests.get(url, timeout=3)
-        return True
-        
-    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
-        return False
-    except Exception as e:
-        app.logger.error(f"Error checking native host: {str(e)}")
-        return False
+        with socket.create_connection((host, port), timeout=0.5):
+            available = True
+    except OSError:
+        available = False
+    
+    native_host_probes[(host, port)] = {'checked_at': time.monotonic(), 'available': available}
+    return available
 
 
 def process_video_sync(video_id):
@@ -139,17 +129,16 @@ def process_video_sync(video_id):
     Can be called from background thread - creates its own app context.
     """
     from flask import current_app
-    from app import socketio, create_app
-    import json
+    from app import socketio
     
-    # Create app context if not in one (for background thread execution)
+    # Use the app of the current context if there is one (for background thread execution)
     app = None
     try:
         # Try to use current_app (if in Flask request context)
         app = current_app._get_current_object()
     except:
-        # Not in request context, create new app
-        app = create_app()
+        # Not in an app context, use the worker's shared app
+        app = get_flask_app()
     
     with app.app_context():
         video = VideoUpload.query.get(video_id)
@@ -183,6 +172,8 @@ def process_video_sync(video_id):
             
             return {'error': error_msg}
         
+        ws_conn = None
+        container = None
         try:
             # Update status
             video.status = 'processing'
@@ -200,100 +191,90 @@ def process_video_sync(video_id):
             # WebSocket server URL (connects to running demo_server.py via native_host)
             ws_url = os.getenv('WEBSOCKET_URL', 'ws://127.0.0.1:8765')
             app.logger.info(f'Connecting to WebSocket server at {ws_url}')
+            ws_conn = create_connection(ws_url, timeout=10)
         
-            # Extract video metadata using OpenCV
-            cap = cv2.VideoCapture(video.filepath)
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            duration = total_frames / fps if fps > 0 else 0
+            # Open video using PyAV; metadata is normally stored at upload, probed otherwise
+            hw_decode_device = app.config.get('HW_DECODE_DEVICE') if app.config.get('USE_HW_DECODE') else None
+            container = open_video(video.filepath, hw_decode_device)
+            fps, total_frames, duration, width, height = get_upload_metadata(video, container)
             
-            # Update video metadata
-            video.duration = duration
-            video.fps = int(fps)
-            video.width = width
-            video.height = height
-            db.session.commit()
+            # Update video metadata if it had to be probed
+            if not video.duration:
+                video.duration = duration
+                video.fps = int(fps)
+                video.width = width
+                video.height = height
+                db.session.commit()
             
             # Extract frames at configured FPS
             target_fps = app.config.get('UPLOAD_FPS', 1)
-            frame_interval = max(1, int(fps / target_fps))
             
-            frame_count = 0
             processed_count = 0
+            consecutive_no_face = 0
+            sample_interval = 1 / target_fps  # Doubled while no faces are found
             
-            app.logger.info(f'Processing video at {target_fps} FPS (every {frame_interval} frames)')
+            app.logger.info(f'Processing video at {target_fps} FPS (every {1 / target_fps:.2f}s)')
         
-            # Process frames using WebSocket
-            while cap.isOpened():
-                ret, frame = cap.read()
+            # Process frames using WebSocket; only the sampled frames are converted to BGR
+            for timestamp, frame in iter_sampled_frames(container, lambda: sample_interval):
+                frame_id = f"upload_{video_id}_frame_{processed_count}"
                 
-                if not ret:
-                    break
+                # Send frame to WebSocket server for inference
+                result = send_frame(ws_conn, frame, frame_id)
                 
-                # Process every Nth frame
-                if frame_count % frame_interval == 0:
-                    timestamp = frame_count / fps
-                    frame_id = f"upload_{video_id}_frame_{processed_count}"
-                    
-                    # Send frame to WebSocket server for inference
-                    result = process_frame_with_ws(ws_url, frame, frame_id)
+                # Extract prediction from result
+                if result and 'prediction' in result:
+                    prediction = result['prediction']
+                    confidence = result.get('confidence', 0.0)
+                    bbox_data = result.get('bbox')
                     
-                    # Extract prediction from result
-                    if result and 'prediction' in result:
-                        prediction = result['prediction']
-                        confidence = result.get('confidence', 0.0)
-                        bbox_data = result.get('bbox')
-                        
-                        # Apply transformations and convert to percentage (0-100)
-                        prediction, confidence = apply_confidence_transformations(prediction, confidence)
-                        confidence = confidence * 100.0  # Convert 0-1 to 0-100 for database
-                        
-                        # Format bbox as JSON string
-                        bbox = json.dumps(bbox_data) if bbox_data else None
-                        
-                        app.logger.info(f'Frame {processed_count}: {prediction} ({confidence:.1f}%)')
-                    else:
-                        # Fallback if WebSocket fails
-                        app.logger.warning(f'WebSocket failed for frame {processed_count}, using fallback')
-                        prediction = 'REAL'
-                        confidence = 50.0
-                        bbox = None
+                    # Sample face-less stretches at half the rate until a face is found again
+                    consecutive_no_face = consecutive_no_face + 1 if prediction == 'NO_FACE' else 0
+                    sample_interval = (2 if consecutive_no_face >= NO_FACE_STREAK else 1) / target_fps
                     
-                    # Save frame result
-                    frame_result = FrameResult(
-                        session_id=session.id,
-                        timestamp=timestamp,
-                        frame_number=processed_count,
-                        prediction=prediction,
-                        confidence=confidence,
-                        bbox=bbox
-                    )
-                    db.session.add(frame_result)
+                    # Apply transformations and convert to percentage (0-100)
+                    prediction, confidence = apply_confidence_transformations(prediction, confidence)
+                    confidence = confidence * 100.0  # Convert 0-1 to 0-100 for database
                     
-                    processed_count += 1
+                    # Format bbox as JSON string
+                    bbox = orjson.dumps(bbox_data).decode() if bbox_data else None
                     
-                    # Update progress after every frame for real-time feedback
-                    progress = (frame_count / total_frames) * 100
-                    video.progress = progress
-                    
-                    # Commit and emit progress every 5 frames
-                    if processed_count % 5 == 0:
-                        db.session.commit()
-                        socketio.emit('processing_progress', {
-                            'video_id': video_id,
-                            'progress': progress,
-                            'processed_frames': processed_count,
-                            'total_frames': total_frames,
-                            'status': 'processing'
-                        }, room=f'video_{video_id}')
-                        app.logger.info(f'Processed {processed_count} frames ({progress:.1f}%)')
+                    app.logger.info(f'Frame {processed_count}: {prediction} ({confidence:.1f}%)')
+                else:
+                    # Fallback if WebSocket fails
+                    app.logger.warning(f'WebSocket failed for frame {processed_count}, using fallback')
+                    prediction = 'REAL'
+                    confidence = 50.0
+                    bbox = None
                 
-                frame_count += 1
-            
-            # Cleanup
-            cap.release()
+                # Save frame result
+                frame_result = FrameResult(
+                    session_id=session.id,
+                    timestamp=timestamp,
+                    frame_number=processed_count,
+                    prediction=prediction,
+                    confidence=confidence,
+                    bbox=bbox
+                )
+                db.session.add(frame_result)
+                
+                processed_count += 1
+                
+                # Update progress after every frame for real-time feedback
+                progress = min(timestamp / duration * 100, 100.0) if duration else 0.0
+                video.progress = progress
+                
+                # Commit and emit progress every 5 frames
+                if processed_count % 5 == 0:
+                    db.session.commit()
+                    socketio.emit('processing_progress', {
+                        'video_id': video_id,
+                        'progress': progress,
+                        'processed_frames': processed_count,
+                        'total_frames': total_frames,
+                        'status': 'processing'
+                    }, room=f'video_{video_id}')
+                    app.logger.info(f'Processed {processed_count} frames ({progress:.1f}%)')
             
             # Update final status
             video.status = 'completed'
@@ -328,3 +309,10 @@ def process_video_sync(video_id):
             }, room=f'video_{video_id}')
             
             return {'error': str(e)}
+        
+        finally:
+            # One connection serves every frame of the video
+            if ws_conn:
+                ws_conn.close()
+            if container:
+                container.close()
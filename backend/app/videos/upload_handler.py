@@ -1,15 +1,47 @@
 import os
+import av
 import cv2
-import json
+import orjson
+import numpy as np
+import simplejpeg
 import time
-import base64
+import queue
+import struct
 import threading
-import asyncio
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 from websocket import create_connection
 from datetime import datetime
 from app.models import db, VideoUpload, DetectionSession, FrameResult
 from app import socketio
+from app.video_io import open_video
+
+# Seconds of video between analyzed frames (1 FPS)
+SAMPLE_INTERVAL = 1.0
+
+# After NO_FACE_STREAK NO_FACE results in a row, frames are sampled every
+# NO_FACE_SAMPLE_INTERVAL seconds until a face shows up again
+NO_FACE_STREAK = 5
+NO_FACE_SAMPLE_INTERVAL = 2 * SAMPLE_INTERVAL
+
+# Sampling gaps (in frames) from which non-reference frames are skipped without decoding
+SKIP_NONREF_MIN_FRAMES = 8
+
+# Frames are coalesced into frame_batch messages of up to UPLOAD_BATCH_SIZE frames or
+# UPLOAD_BATCH_MAX_BYTES of JPEG data; up to BATCHES_IN_FLIGHT are ahead of the receiver
+UPLOAD_BATCH_SIZE = 4
+UPLOAD_BATCH_MAX_BYTES = 256 * 1024
+BATCHES_IN_FLIGHT = 2
+END_OF_FRAMES = object()
+
+# Threads resizing and JPEG-encoding frames while the sender thread decodes the next ones
+ENCODE_WORKERS = 2
+encode_buffers = threading.local()
+
+# Frame results are committed in groups; progress events are throttled
+COMMIT_EVERY_FRAMES = 10
+COMMIT_INTERVAL = 0.1  # seconds
+PROGRESS_EMIT_INTERVAL = 0.05  # seconds
 
 
 def emit_progress(app, video_id, data):
@@ -41,6 +73,235 @@ def emit_error(app, video_id, error):
             print(f"[UPLOAD] ❌ Error emitting error: {e}")
 
 
+def save_frame_results(app, frame_results):
+    """Insert buffered FrameResult rows with a single commit"""
+    if not frame_results:
+        return
+    with app.app_context():
+        db.session.add_all(frame_results)
+        db.session.commit()
+    frame_results.clear()
+
+
+def iter_sampled_frames(container, interval):
+    """
+    Yield (timestamp, frame) for the first frame at or after every interval seconds of the
+    container's first video stream, frame as a BGR array. FFmpeg decodes with frame/slice
+    threads, and frames in between are never converted out of the decoder's pixel format.
+    When frames are sampled sparsely, non-reference frames (which nothing else is predicted
+    from) are dropped by the decoder instead, so a sample may land a frame or two later.
+    When the next sample is more than two keyframe gaps away, the demuxer seeks to the
+    keyframe before it rather than decoding everything in between.
+    interval may also be a callable returning the current interval, so it can change
+    while frames are being read.
+    """
+    stream = container.streams.video[0]
+    stream.thread_type = 'AUTO'
+    current_interval = interval if callable(interval) else (lambda: interval)
+    if current_interval() * float(stream.average_rate or 0) >= SKIP_NONREF_MIN_FRAMES:
+        stream.codec_context.skip_frame = 'NONREF'
+    start_time = None
+    next_timestamp = 0.0
+    keyframe_time = None
+    keyframe_gap = None  # Largest distance between consecutive keyframes seen so far
+    seek_to = None
+    
+    while True:
+        if seek_to is not None:
+            container.seek(int(seek_to / stream.time_base), stream=stream, backward=True)
+            keyframe_time = None
+            seek_to = None
+        
+        for frame in container.decode(stream):
+            if frame.time is None:
+                continue
+            if start_time is None:
+                start_time = frame.time
+            if frame.key_frame:
+                if keyframe_time is not None and frame.time > keyframe_time:
+                    keyframe_gap = max(keyframe_gap or 0.0, frame.time - keyframe_time)
+                keyframe_time = frame.time
+            
+            timestamp = frame.time - start_time
+            if timestamp >= next_timestamp:
+                yield timestamp, frame.to_ndarray(format='bgr24')
+                step = current_interval()
+                while next_timestamp <= timestamp:
+                    next_timestamp += step
+                
+                if keyframe_gap and next_timestamp - timestamp > 2 * keyframe_gap:
+                    seek_to = start_time + next_timestamp
+                    break
+        else:
+            return
+
+
+def get_video_metadata(container):
+    """Return (fps, total_frames, duration, width, height) of the container's first video stream"""
+    stream = container.streams.video[0]
+    fps = float(stream.average_rate or 0)
+    if container.duration:
+        duration = container.duration / av.time_base
+    elif stream.duration and stream.time_base:
+        duration = float(stream.duration * stream.time_base)
+    else:
+        duration = 0
+    total_frames = stream.frames or int(duration * fps)
+    return fps, total_frames, duration, stream.codec_context.width, stream.codec_context.height
+
+
+def get_upload_metadata(video, container):
+    """
+    Return (fps, total_frames, duration, width, height) for an upload: the values stored on
+    the VideoUpload row at upload time when present, otherwise probed from the container
+    """
+    if video.duration and video.fps and video.width and video.height:
+        return float(video.fps), int(video.duration * video.fps), video.duration, video.width, video.height
+    return get_video_metadata(container)
+
+
+def build_frame_message(message, jpeg):
+    """
+    Build a binary server.py frame message: <uint32 header length><JSON header><JPEG bytes>.
+    Same fields as the JSON frame message, minus the base64 'frameB64' payload.
+    """
+    header = orjson.dumps(message)
+    return b''.join((struct.pack('<I', len(header)), header, jpeg))
+
+
+def build_batch_message(batch_info, batch):
+    """
+    Build a binary server.py frame_batch message for a list of (frame_info, jpeg) pairs:
+    <uint32 header length><JSON header><JPEG bytes of each frame, back to back>
+    batch_info holds the fields shared by every frame of the video.
+    """
+    header = orjson.dumps({
+        'type': 'frame_batch',
+        **batch_info,
+        'frames': [{**frame_info, 'size': len(jpeg)} for frame_info, jpeg in batch]
+    })
+    return b''.join([struct.pack('<I', len(header)), header] + [jpeg for _, jpeg in batch])
+
+
+def put_unless_stopped(in_flight, item, stop_event):
+    """Put item on the bounded in-flight queue, giving up once stop_event is set"""
+    while not stop_event.is_set():
+        try:
+            in_flight.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def encode_upload_frame(frame):
+    """
+    Resize (max width 640px) and JPEG-encode a frame; runs on the sender's encode pool.
+    Each pool thread resizes into its own reused buffer: the JPEG encoder copies the
+    pixels out before that thread's next resize.
+    """
+    h, w = frame.shape[:2]
+    if w > 640:
+        scale = 640 / w
+        new_w, new_h = 640, int(h * scale)
+        resized = getattr(encode_buffers, 'resized', None)
+        if resized is None or resized.shape[:2] != (new_h, new_w):
+            resized = encode_buffers.resized = np.empty((new_h, new_w, 3), dtype=np.uint8)
+        frame = cv2.resize(frame, (new_w, new_h), dst=resized, interpolation=cv2.INTER_LINEAR)
+    
+    # Encode frame to JPEG (65% quality for much faster processing;
+    # libjpeg-turbo SIMD via simplejpeg, 4:2:0 like cv2.imencode)
+    return simplejpeg.encode_jpeg(frame, quality=65, colorspace='BGR', colorsubsampling='420')
+
+
+def send_upload_frames(app, video_id, container, ws_conn, duration, total_frames_to_process, in_flight, stop_event, sampling):
+    """
+    Sender thread: decode one frame per sampling['interval'] seconds (raised by the receiver
+    while no faces are found), resize and encode it on a small
+    thread pool (OpenCV and libjpeg-turbo release the GIL, so this overlaps with decoding)
+    and send the frames, in order, to server.py in frame_batch messages. Each batch's list
+    of (frame_number, timestamp, current_second) goes on the in-flight queue before it is
+    sent, so at most BATCHES_IN_FLIGHT batches are ahead of the receiver.
+    Ends with END_OF_FRAMES.
+    """
+    sent_count = 0
+    encoding = deque()  # (timestamp, future) in frame order
+    
+    # Same for every frame of the video, so sent once per batch rather than per frame
+    batch_info = {
+        'videoId': f'upload_{video_id}',
+        'source': 'web_upload',
+        'totalFrames': total_frames_to_process,
+        'videoDuration': duration
+    }
+    batch = []
+    batch_frames = []
+    batch_bytes = 0
+    
+    def send_batch():
+        if not put_unless_stopped(in_flight, batch_frames, stop_event):
+            return False
+        try:
+            ws_conn.send_binary(build_batch_message(batch_info, batch))
+        except Exception as e:
+            print(f"[UPLOAD] ❌ ERROR sending frames {batch_frames[0][0]}-{batch_frames[-1][0]}: {e}")
+            emit_error(app, video_id, f"Failed to send frame: {str(e)}")
+            return False
+        return True
+    
+    def add_encoded_frame(timestamp, future):
+        """Add the next encoded frame to the batch, sending it once full; False once sending failed"""
+        nonlocal sent_count, batch, batch_frames, batch_bytes
+        try:
+            jpeg = future.result()
+        except Exception as e:
+            print(f"[UPLOAD] ❌ Failed to encode frame at {timestamp:.2f}s: {e}")
+            return True
+        
+        # Per-frame fields (same as extension); the JPEG follows the batch header as raw bytes.
+        # currentFrame follows the timestamp so progress stays right when frames are skipped
+        frame_info = {
+            'id': f'upload_{video_id}_frame_{sent_count}',
+            'ts': timestamp,
+            'currentFrame': int(timestamp / SAMPLE_INTERVAL) + 1
+        }
+        batch.append((frame_info, jpeg))
+        batch_frames.append((sent_count, timestamp, int(timestamp)))
+        batch_bytes += len(jpeg)
+        sent_count += 1
+        
+        # Send frames to server.py once the batch is full
+        if len(batch) >= UPLOAD_BATCH_SIZE or batch_bytes >= UPLOAD_BATCH_MAX_BYTES:
+            sent = send_batch()
+            batch, batch_frames, batch_bytes = [], [], 0
+            return sent
+        return True
+    
+    try:
+        sending = True
+        with ThreadPoolExecutor(max_workers=ENCODE_WORKERS) as encode_pool:
+            for timestamp, frame in iter_sampled_frames(container, lambda: sampling['interval']):
+                if stop_event.is_set():
+                    break
+                
+                encoding.append((timestamp, encode_pool.submit(encode_upload_frame, frame)))
+                if len(encoding) > ENCODE_WORKERS:
+                    sending = add_encoded_frame(*encoding.popleft())
+                    if not sending:
+                        break
+            
+            while sending and encoding and not stop_event.is_set():
+                sending = add_encoded_frame(*encoding.popleft())
+        
+        if sending and batch:
+            send_batch()
+    except Exception as e:
+        print(f"[UPLOAD] ❌ ERROR reading frames: {e}")
+        emit_error(app, video_id, f"Failed to read video: {str(e)}")
+    finally:
+        put_unless_stopped(in_flight, END_OF_FRAMES, stop_event)
+
+
 def process_video_upload(app, video_id, ws_url='ws://127.0.0.1:8765'):
     """Process uploaded video: extract frames and send to server.py for analysis"""
     print(f"\n{'='*80}")
@@ -49,8 +310,10 @@ def process_video_upload(app, video_id, ws_url='ws://127.0.0.1:8765'):
     print(f"{'='*80}\n")
     
     ws_conn = None
-    cap = None
+    container = None
     session_id = None
+    sender = None
+    stop_event = threading.Event()
     
     try:
         with app.app_context():
@@ -72,20 +335,17 @@ def process_video_upload(app, video_id, ws_url='ws://127.0.0.1:8765'):
             
             # Extract video metadata
             print(f"[UPLOAD] 📹 Opening video file: {video_path}")
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                print(f"[UPLOAD] ❌ Failed to open video file: {video_path}")
+            try:
+                hw_decode_device = app.config.get('HW_DECODE_DEVICE') if app.config.get('USE_HW_DECODE') else None
+                container = open_video(video_path, hw_decode_device)
+            except av.error.FFmpegError as e:
+                print(f"[UPLOAD] ❌ Failed to open video file: {video_path} ({e})")
                 emit_error(app, video_id, "Failed to open video file")
                 return
             
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            duration = total_frames / fps if fps > 0 else 0
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fps, total_frames, duration, width, height = get_upload_metadata(video, container)
             
             # Calculate how many frames we'll process (1 FPS)
-            frame_interval = max(1, int(fps))  # Process 1 frame per second
             total_frames_to_process = int(duration)  # Total seconds
             
             print(f"[UPLOAD] 📊 Video metadata:")
@@ -93,7 +353,7 @@ def process_video_upload(app, video_id, ws_url='ws://127.0.0.1:8765'):
             print(f"  - FPS: {fps:.2f}")
             print(f"  - Total frames: {total_frames}")
             print(f"  - Resolution: {width}x{height}")
-            print(f"  - Processing interval: {frame_interval} frames (1 FPS)")
+            print(f"  - Processing interval: {SAMPLE_INTERVAL:.1f}s (1 FPS)")
             print(f"  - Frames to process: {total_frames_to_process}")
             
             # Update session status
@@ -107,70 +367,35 @@ def process_video_upload(app, video_id, ws_url='ws://127.0.0.1:8765'):
         ws_conn = create_connection(ws_url, timeout=10)
         print(f"[UPLOAD] ✅ Connected to server.py successfully!")
         
-        frame_count = 0
         processed_count = 0
-        sent_frames = []  # Track sent frames for matching responses
+        pending_results = []
+        consecutive_no_face = 0
+        sampling = {'interval': SAMPLE_INTERVAL}
+        last_commit_at = last_emit_at = time.monotonic()
         
-        # PHASE 1: Send all frames (non-blocking)
-        print(f"[UPLOAD] 📤 PHASE 1: Sending all frames to server...")
-        send_start_time = time.time()
+        # Read/encode/send on a sender thread while earlier frames are being analyzed;
+        # server.py answers each batch once and in order, so responses match the queue
+        print(f"[UPLOAD] 📤 Streaming frames to server (batches of {UPLOAD_BATCH_SIZE}, {BATCHES_IN_FLIGHT} in flight)...")
+        in_flight = queue.Queue(maxsize=BATCHES_IN_FLIGHT)
+        sender = threading.Thread(
+            target=send_upload_frames,
+            args=(app, video_id, container, ws_conn, duration, total_frames_to_process, in_flight, stop_event, sampling),
+            daemon=True
+        )
+        sender.start()
         
-        # Process frames
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                print(f"[UPLOAD] 🏁 No more frames to read (total read: {frame_count})")
+        is_complete = False
+        while not is_complete:
+            batch_frames = in_flight.get()
+            if batch_frames is END_OF_FRAMES:
                 break
             
-            # Process every Nth frame (1 FPS)
-            if frame_count % frame_interval == 0:
-                timestamp = frame_count / fps
-                current_second = int(timestamp)
-                
-                # Resize frame to reduce processing time (max width 640px)
-                h, w = frame.shape[:2]
-                if w > 640:
-                    scale = 640 / w
-                    new_w, new_h = 640, int(h * scale)
-                    frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA)
-                
-                # Encode frame to JPEG base64 (65% quality for much faster processing)
-                success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 65])
-                if not success:
-                    print(f"[UPLOAD] ❌ Failed to encode frame {frame_count}")
-                    frame_count += 1
-                    continue
-                
-                # Convert to base64
-                jpg_as_text = base64.b64encode(buffer).decode('utf-8')
-                data_url = f"data:image/jpeg;base64,{jpg_as_text}"
-                
-                # Prepare message (same format as extension)
-                message = {
-                    'type': 'frame',
-                    'id': f'upload_{video_id}_frame_{processed_count}',
-                    'videoId': f'upload_{video_id}',
-                    'ts': timestamp,
-                    'frameB64': data_url,
-                    'source': 'web_upload',
-                    'totalFrames': total_frames_to_process,
-                    'currentFrame': processed_count + 1,
-                    'videoDuration': duration
-                }
-                
-                # Send frame to server.py
-                try:
-                    ws_conn.send(json.dumps(message))
-                except Exception as e:
-                    print(f"[UPLOAD] ❌ ERROR sending frame {processed_count}: {e}")
-                    emit_error(app, video_id, f"Failed to send frame: {str(e)}")
-                    break
+            # Wait for the batch's response from server.py
+            try:
+                response = orjson.loads(ws_conn.recv())
+                results = (response.get('results') or []) if response.get('type') == 'batch_result' else []
                 
-                # Wait for response from server.py
-                try:
-                    response = ws_conn.recv()
-                    result = json.loads(response)
-                    
+                for (frame_number, timestamp, current_second), result in zip(batch_frames, results):
                     # Process analysis result
                     if result.get('type') == 'result':
                         # Extract data first
@@ -181,52 +406,61 @@ def process_video_upload(app, video_id, ws_url='ws://127.0.0.1:8765'):
                         current_sec = result.get('currentSecond', current_second)
                         total_secs = result.get('totalSeconds', int(duration))
                         is_complete = result.get('isComplete', False)
-                        
+                    
                         # Convert confidence from 0-1 to 0-100
                         confidence_pct = confidence * 100.0
-                        
-                        # Save result to database in app context
-                        with app.app_context():
-                            frame_result = FrameResult(
-                                session_id=session_id,
-                                timestamp=timestamp,
-                                frame_number=processed_count,
-                                prediction=prediction,
-                                confidence=confidence_pct,
-                                bbox=json.dumps(bbox) if bbox else None
-                            )
-                            db.session.add(frame_result)
-                            db.session.commit()
-                        
+                    
+                        # Buffer the result; saved every COMMIT_EVERY_FRAMES frames or COMMIT_INTERVAL
+                        pending_results.append(FrameResult(
+                            session_id=session_id,
+                            timestamp=timestamp,
+                            frame_number=frame_number,
+                            prediction=prediction,
+                            confidence=confidence_pct,
+                            bbox=orjson.dumps(bbox).decode() if bbox else None
+                        ))
+                    
                         processed_count += 1
-                        
-                        # Emit progress to frontend (has its own app context)
+                    
+                        # Sample face-less stretches more sparsely, back to SAMPLE_INTERVAL once a face is found
+                        consecutive_no_face = consecutive_no_face + 1 if prediction == 'NO_FACE' else 0
+                        sampling['interval'] = NO_FACE_SAMPLE_INTERVAL if consecutive_no_face >= NO_FACE_STREAK else SAMPLE_INTERVAL
+                    
+                        now = time.monotonic()
+                        if len(pending_results) >= COMMIT_EVERY_FRAMES or now - last_commit_at >= COMMIT_INTERVAL:
+                            save_frame_results(app, pending_results)
+                            last_commit_at = now
+                    
+                        # Emit progress to frontend (has its own app context); the frontend only
+                        # shows the latest state, so at most one event per PROGRESS_EMIT_INTERVAL
                         if 'progress' in result:
-                            emit_progress(app, video_id, {
-                                'progress': progress_percent,
-                                'message': f'Analyzing: {current_sec}s / {total_secs}s',
-                                'total_seconds': total_secs,
-                                'current_second': current_sec,
-                                'processed_frames': processed_count
-                            })
-                            
+                            if now - last_emit_at >= PROGRESS_EMIT_INTERVAL:
+                                emit_progress(app, video_id, {
+                                    'progress': progress_percent,
+                                    'message': f'Analyzing: {current_sec}s / {total_secs}s',
+                                    'total_seconds': total_secs,
+                                    'current_second': current_sec,
+                                    'processed_frames': processed_count
+                                })
+                                last_emit_at = now
+                        
                             if processed_count % 3 == 0:  # Log every 3 frames instead of every frame
                                 print(f"[UPLOAD] 📊 Progress: {progress_percent:.1f}% ({current_sec}s / {total_secs}s)")
-                            
+                        
                             # Check for completion
                             if is_complete:
                                 print(f"[UPLOAD] 🎉 Received completion flag from server.py")
                                 break
-                    
-                except Exception as e:
-                    print(f"[UPLOAD] ❌ ERROR receiving/processing response: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    emit_error(app, video_id, f"Error processing frame: {str(e)}")
-            
-            frame_count += 1
+                
+            except Exception as e:
+                print(f"[UPLOAD] ❌ ERROR receiving/processing response: {e}")
+                import traceback
+                traceback.print_exc()
+                emit_error(app, video_id, f"Error processing frame: {str(e)}")
+        
+        # Save what is still buffered, then mark as completed
+        save_frame_results(app, pending_results)
         
-        # Cleanup and mark as completed
         with app.app_context():
             session = DetectionSession.query.get(session_id)
             session.status = 'completed'
@@ -265,17 +499,26 @@ def process_video_upload(app, video_id, ws_url='ws://127.0.0.1:8765'):
             pass
     
     finally:
-        # Cleanup resources
-        if cap:
-            cap.release()
-            print("[UPLOAD] 🧹 Released video capture")
+        # Cleanup resources (stop the sender before releasing what it reads from)
+        stop_event.set()
+        if sender is not None:
+            sender.join()
+        if container:
+            container.close()
+            print("[UPLOAD] 🧹 Closed video container")
         if ws_conn:
             ws_conn.close()
             print("[UPLOAD] 🧹 Closed WebSocket connection")
 
 
 def start_video_processing(app, video_id):
-    """Start video processing in a background thread"""
+    """Queue video processing on the Celery worker, or a background thread when Celery is disabled"""
+    if app.config.get('USE_CELERY_WORKER'):
+        from app.videos.tasks import process_video_upload_task
+        result = process_video_upload_task.delay(video_id)
+        print(f"[UPLOAD] 🚀 Queued video {video_id} for processing (task_id: {result.id})")
+        return
+    
     print(f"[UPLOAD] 🚀 Starting background thread for video {video_id}")
     
     # Use threading instead of socketio background task
@@ -0,0 +1,25 @@
+"""
+Request wrapper for SpotifAI backend.
+"""
+import io
+import tempfile
+
+from flask import Request
+
+
+class UploadRequest(Request):
+    """
+    Keep small uploads in memory and spool large ones to named temporary files.
+    Werkzeug's default spool rolls over to disk at 500KB, into an anonymous
+    TemporaryFile, so a route has to copy the whole upload again with
+    file.save(). Here uploads up to IN_MEMORY_MAX_SIZE never touch the disk,
+    and larger ones can be hard-linked into place (see public /analyze).
+    """
+
+    IN_MEMORY_MAX_SIZE = 16 * 1024 * 1024  # 16MB
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= self.IN_MEMORY_MAX_SIZE:
+            return io.BytesIO()
+
+        return tempfile.NamedTemporaryFile('wb+', prefix='spotifai_upload_')
@@ -1,11 +1,10 @@
 """
 Celery worker configuration.
 """
-from app import create_app
-from app.videos.tasks import celery
-import os
+from app.videos.tasks import celery, get_flask_app
 
-app = create_app(os.getenv('FLASK_ENV', 'development'))
+# Created once here and reused by every task in the worker
+app = get_flask_app()
 
 # Configure Celery from Flask config
 celery.conf.update(
@@ -16,6 +15,10 @@ celery.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    # One video per prefork child; each child only takes a new task when it is free,
+    # so long videos don't hold queued ones back while other children sit idle
+    worker_concurrency=app.config['CELERY_WORKER_CONCURRENCY'],
+    worker_prefetch_multiplier=1,
 )
 
 if __name__ == '__main__':
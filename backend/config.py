@@ -32,17 +32,23 @@ class Config:
     
     # SocketIO
     SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', 'redis://localhost:6379/0')
+    SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')  # 'threading' (native threads) or 'eventlet'
     
     # Video Upload
     MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 524288000))  # 500 MB
+    MAX_CONTENT_LENGTH = MAX_UPLOAD_SIZE  # Reject oversize bodies before form parsing
     UPLOAD_FPS = int(os.getenv('UPLOAD_FPS', 10))
     VIDEO_RETENTION_DAYS = int(os.getenv('VIDEO_RETENTION_DAYS', 30))
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', './media/uploads')
     ALLOWED_EXTENSIONS = set(os.getenv('ALLOWED_EXTENSIONS', 'mp4,avi,mov,mkv,webm').split(','))
+    USE_CELERY_WORKER = os.getenv('USE_CELERY_WORKER', 'false').lower() == 'true'  # Process uploads on the Celery worker instead of a thread in the web process
     
     # Deepfake Detection
     INFERENCE_SERVER_HOST = os.getenv('INFERENCE_SERVER_HOST', '127.0.0.1')
     INFERENCE_SERVER_PORT = int(os.getenv('INFERENCE_SERVER_PORT', 8765))
+    INFERENCE_INPUT_SIZE = int(os.getenv('INFERENCE_INPUT_SIZE', 640))  # Longest frame side sent for inference
+    USE_HW_DECODE = os.getenv('USE_HW_DECODE', 'false').lower() == 'true'  # Decode uploads on the GPU (NVDEC/VAAPI)
+    HW_DECODE_DEVICE = os.getenv('HW_DECODE_DEVICE', 'cuda')  # FFmpeg hwdevice type: cuda, vaapi, qsv, videotoolbox
     MODEL_WEIGHTS_PATH = os.getenv('MODEL_WEIGHTS_PATH', '../DeepfakeBench/training/weights/effort_clip_L14_trainOn_FaceForensic.pth')
     
     # Native Host WebSocket URL (for video processing deepfake detection)
@@ -51,6 +57,7 @@ class Config:
     # Celery
     CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/1')
     CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/1')
+    CELERY_WORKER_CONCURRENCY = int(os.getenv('CELERY_WORKER_CONCURRENCY', os.cpu_count() or 1))  # Videos processed at once per worker
     
     # Pagination
     DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE', 50))
@@ -83,6 +90,7 @@ class ProductionConfig(Config):
     """Production configuration."""
     DEBUG = False
     TESTING = False
+    USE_CELERY_WORKER = os.getenv('USE_CELERY_WORKER', 'true').lower() == 'true'  # Worker + Redis run alongside (docker-compose)
 
 
 class TestingConfig(Config):
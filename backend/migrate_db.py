@@ -0,0 +1,132 @@
+"""
+Migrate an existing database to the current schema.
+Run this script after upgrading; init_db.py only creates missing tables.
+Every step checks whether it is still needed, so running it again is safe.
+"""
+import os
+from sqlalchemy import text
+from app import create_app, db
+from app.models import FrameResult
+
+
+def timestamp_server_defaults(connection):
+    """Give created_at/updated_at the database-side UTC default the models now rely on."""
+    # Columns that are only filled by server_default (see utcnow in app.models)
+    columns = [
+        ('users', 'created_at'), ('users', 'updated_at'),
+        ('video_uploads', 'created_at'), ('video_uploads', 'updated_at'),
+        ('frame_results', 'created_at'),
+        ('aggregated_verdicts', 'created_at'),
+    ]
+    applied = False
+    for table, column in columns:
+        has_default = connection.execute(text(
+            "SELECT column_default IS NOT NULL FROM information_schema.columns "
+            "WHERE table_schema = 'public' AND table_name = :table AND column_name = :column"
+        ), {'table': table, 'column': column}).scalar()
+        if has_default is False:
+            connection.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP)"
+            ))
+            applied = True
+    return applied
+
+
+def partition_frame_results(connection):
+    """Rebuild a plain frame_results table as the hash-partitioned one, keeping its rows."""
+    relkind = connection.execute(text(
+        "SELECT relkind FROM pg_class WHERE relname = 'frame_results' AND relnamespace = 'public'::regnamespace"
+    )).scalar()
+    if relkind != 'r':
+        return False  # Already partitioned ('p'), or missing (db.create_all builds it)
+
+    connection.execute(text("ALTER TABLE frame_results RENAME TO frame_results_old"))
+    # Index and sequence names are schema-wide: move the old ones out of the new table's way
+    connection.execute(text("ALTER INDEX IF EXISTS frame_results_pkey RENAME TO frame_results_old_pkey"))
+    connection.execute(text("ALTER INDEX IF EXISTS idx_session_timestamp RENAME TO idx_session_timestamp_old"))
+    connection.execute(text("ALTER INDEX IF EXISTS ix_frame_results_session_id RENAME TO ix_frame_results_session_id_old"))
+    connection.execute(text("ALTER SEQUENCE IF EXISTS frame_results_id_seq RENAME TO frame_results_old_id_seq"))
+
+    # Partitioned table plus its partitions (after_create DDL in app.models)
+    FrameResult.__table__.create(connection)
+
+    columns = ', '.join(column.name for column in FrameResult.__table__.columns)
+    connection.execute(text(f"INSERT INTO frame_results ({columns}) SELECT {columns} FROM frame_results_old"))
+    connection.execute(text(
+        "SELECT setval(pg_get_serial_sequence('frame_results', 'id'), "
+        "COALESCE((SELECT MAX(id) FROM frame_results), 0) + 1, false)"
+    ))
+    connection.execute(text("DROP TABLE frame_results_old"))
+    return True
+
+
+def cascade_session_children(connection):
+    """Give the session foreign keys of frame_results and aggregated_verdicts ON DELETE CASCADE."""
+    applied = False
+    for table in ('frame_results', 'aggregated_verdicts'):
+        # Only the table's own constraint: partitions inherit theirs from it
+        constraint_names = connection.execute(text(
+            "SELECT conname FROM pg_constraint "
+            "WHERE contype = 'f' AND conparentid = 0 AND conrelid = to_regclass(:table) "
+            "AND confrelid = 'detection_sessions'::regclass AND confdeltype <> 'c'"
+        ), {'table': table}).scalars().all()
+
+        for name in constraint_names:
+            connection.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+            connection.execute(text(
+                f'ALTER TABLE {table} ADD CONSTRAINT "{name}" '
+                f'FOREIGN KEY (session_id) REFERENCES detection_sessions (id) ON DELETE CASCADE'
+            ))
+            applied = True
+    return applied
+
+
+def json_columns_to_jsonb(connection):
+    """Convert the JSON columns the models declare as JSONB (see JSONType in app.models)."""
+    # frame_results is already JSONB when the partition step rebuilt it
+    columns = [
+        ('detection_sessions', 'session_metadata'),
+        ('frame_results', 'bbox'),
+        ('frame_results', 'model_outputs'),
+    ]
+    applied = False
+    for table, column in columns:
+        data_type = connection.execute(text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_schema = 'public' AND table_name = :table AND column_name = :column"
+        ), {'table': table, 'column': column}).scalar()
+        if data_type == 'json':
+            connection.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE jsonb USING {column}::jsonb"
+            ))
+            applied = True
+    return applied
+
+
+# (description, step) in the order they must run
+MIGRATIONS = [
+    ('Database-side created_at/updated_at defaults', timestamp_server_defaults),
+    ('Hash-partition frame_results by session_id', partition_frame_results),
+    ('ON DELETE CASCADE for session frame results and verdicts', cascade_session_children),
+    ('JSONB session metadata and frame results', json_columns_to_jsonb),
+]
+
+
+def migrate_database():
+    """Apply every pending migration step in one transaction."""
+    app = create_app(os.getenv('FLASK_ENV', 'development'))
+
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            print("Nothing to migrate: these steps only apply to PostgreSQL.")
+            return
+
+        with db.engine.begin() as connection:
+            for description, step in MIGRATIONS:
+                applied = step(connection)
+                print(f"{'✓' if applied else '-'} {description}{'' if applied else ' (already up to date)'}")
+
+        print("\nDatabase migration complete!")
+
+if __name__ == '__main__':
+    migrate_database()
@@ -1,19 +1,28 @@
 """
 Main application entry point for Flask server.
 """
-# Monkey patch for eventlet BEFORE importing anything else
-import eventlet
-eventlet.monkey_patch()
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Monkey patch for eventlet BEFORE importing anything else (only when eventlet is selected;
+# the default threading mode serves SocketIO on native threads with no patching)
+if os.getenv('SOCKETIO_ASYNC_MODE', 'threading') == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
 
 from app import create_app, socketio
-import os
 
 app = create_app(os.getenv('FLASK_ENV', 'development'))
 
 if __name__ == '__main__':
+    # Development server only; production runs this module's `app` under gunicorn's gthread
+    # worker (see Dockerfile), so Werkzeug is only allowed when debugging
     socketio.run(
         app,
         host='0.0.0.0',
         port=5000,
-        debug=app.config['DEBUG']
+        debug=app.config['DEBUG'],
+        allow_unsafe_werkzeug=app.config['DEBUG']
     )
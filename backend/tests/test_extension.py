@@ -0,0 +1,61 @@
+"""
+Tests for the extension sync endpoint (SQLite testing config).
+"""
+import unittest
+
+from app import create_app, db
+from app.models import ExtensionLink, FrameResult, User
+
+
+class ExtensionSyncTest(unittest.TestCase):
+    """POST /api/extension/sync with a linked extension token"""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+        user = User(email='user@example.com', username='user')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(ExtensionLink(user_id=user.id, extension_token='token'))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def sync(self, frames):
+        return self.client.post('/api/extension/sync', json={
+            'extension_token': 'token',
+            'video_url': 'https://youtube.com/watch?v=xxx',
+            'frames': frames
+        })
+
+    def test_malformed_frame_is_skipped(self):
+        response = self.sync([
+            {'timestamp': 0, 'frame_number': 0, 'prediction': 'REAL', 'confidence': 0.9},
+            {'timestamp': 'soon', 'frame_number': 1, 'prediction': 'FAKE', 'confidence': 0.8},
+            None,
+            {'timestamp': 2, 'frame_number': 2, 'prediction': 'FAKE', 'confidence': 0.7},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.get_json()['frames_synced'], 2)
+        self.assertEqual([frame.frame_number for frame in FrameResult.query.order_by(FrameResult.frame_number)], [0, 2])
+
+    def test_numeric_strings_are_coerced(self):
+        response = self.sync([
+            {'timestamp': '1.5', 'frame_number': '1', 'prediction': 'REAL', 'confidence': '0.5',
+             'bbox': ['0.1', '0.2', '0.3', '0.4']},
+        ])
+        self.assertEqual(response.status_code, 201)
+        frame = FrameResult.query.one()
+        self.assertEqual((frame.timestamp, frame.frame_number, frame.confidence), (1.5, 1, 50.0))
+        self.assertEqual(frame.bbox, [0.1, 0.2, 0.3, 0.4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Tests for the WSGI middleware.
+"""
+import gzip
+import http.client
+import json
+import threading
+import unittest
+
+from werkzeug.serving import make_server
+from werkzeug.wrappers import Request, Response
+
+from app.middleware import RequestDecompressionMiddleware
+
+
+@Request.application
+def echo_app(request):
+    """Echo the (decompressed) request body back as JSON"""
+    return Response(json.dumps({'body': request.get_data(as_text=True)}), mimetype='application/json')
+
+
+class RequestDecompressionMiddlewareTest(unittest.TestCase):
+    """Gzip bodies sent to Werkzeug's threaded server over a keep-alive connection"""
+
+    def setUp(self):
+        app = RequestDecompressionMiddleware(echo_app, max_size=1024)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.connection = http.client.HTTPConnection('127.0.0.1', self.server.port, timeout=5)
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.thread.join()
+
+    def post_gzip(self, payload):
+        self.connection.request('POST', '/', body=gzip.compress(payload), headers={
+            'Content-Encoding': 'gzip',
+            'Content-Type': 'application/json',
+            'Connection': 'keep-alive'
+        })
+        response = self.connection.getresponse()
+        return response.status, response.read()
+
+    def test_gzip_body_on_keep_alive_connection(self):
+        # Two requests on one connection: the body must be read up to CONTENT_LENGTH, not EOF
+        for payload in (b'{"first": 1}', b'{"second": 2}'):
+            status, body = self.post_gzip(payload)
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body)['body'], payload.decode())
+
+    def test_oversize_body_rejected(self):
+        status, body = self.post_gzip(b'x' * 2048)
+        self.assertEqual(status, 413)
+        self.assertEqual(json.loads(body)['error'], 'Payload Too Large')
+
+
+if __name__ == '__main__':
+    unittest.main()
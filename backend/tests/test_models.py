@@ -0,0 +1,66 @@
+"""
+Tests for the database models (SQLite testing config).
+"""
+import unittest
+
+from app import create_app, db
+from app.models import AggregatedVerdict, DetectionSession, FrameResult, User, VideoUpload
+
+
+class SessionDeleteCascadeTest(unittest.TestCase):
+    """Session children are removed by the database's ON DELETE CASCADE"""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+        self.user = User(email='user@example.com', username='user')
+        db.session.add(self.user)
+        db.session.flush()
+        self.video = VideoUpload(user_id=self.user.id, filename='clip.mp4', filepath='/tmp/clip.mp4', filesize=1)
+        db.session.add(self.video)
+        db.session.flush()
+        self.session = DetectionSession(user_id=self.user.id, video_id=self.video.id, source='web_upload', fps=1)
+        db.session.add(self.session)
+        db.session.flush()
+
+        db.session.add_all([
+            FrameResult(session_id=self.session.id, timestamp=second, frame_number=second,
+                        prediction='REAL', confidence=90.0)
+            for second in range(3)
+        ])
+        db.session.add(AggregatedVerdict(session_id=self.session.id, window_start=0, window_end=3,
+                                         verdict='REAL', confidence=90.0))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def assert_children_deleted(self):
+        self.assertEqual(FrameResult.query.count(), 0)
+        self.assertEqual(AggregatedVerdict.query.count(), 0)
+        self.assertEqual(DetectionSession.query.count(), 0)
+
+    def test_delete_session(self):
+        db.session.delete(self.session)
+        db.session.commit()
+        self.assert_children_deleted()
+
+    def test_delete_video(self):
+        db.session.delete(self.video)
+        db.session.commit()
+        self.assert_children_deleted()
+
+    def test_delete_user(self):
+        db.session.delete(self.user)
+        db.session.commit()
+        self.assert_children_deleted()
+        self.assertEqual(VideoUpload.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
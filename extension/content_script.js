@@ -90,12 +90,18 @@ async function syncToBackend() {
     console.log(`[DF EXT] 🎬 Video: ${videoTitle}`);
     console.log(`[DF EXT] 📊 Stats: ${stats.totalFrames} total, ${stats.fakeFrames} fake, ${stats.realFrames} real`);
     
+    // Gzip the payload (backend inflates Content-Encoding: gzip bodies)
+    const compressedBody = await new Response(
+      new Blob([JSON.stringify(syncPayload)]).stream().pipeThrough(new CompressionStream('gzip'))
+    ).arrayBuffer();
+    
     const response = await fetch(`${BACKEND_API_URL}/extension/sync`, {
       method: 'POST',
       headers: {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        'Content-Encoding': 'gzip'
       },
-      body: JSON.stringify(syncPayload)
+      body: compressedBody
     });
     
     if (response.ok) {
@@ -796,6 +802,14 @@ function aggregateAndShowVerdict() {
 }
 
 // --- CAPTURE & SEND ---
+// Binary frame message: <uint32 LE header length><JSON header><JPEG bytes>, no base64
+function buildFrameMessage(header, jpegBlob) {
+  const headerBytes = new TextEncoder().encode(JSON.stringify(header));
+  const prefix = new Uint8Array(4);
+  new DataView(prefix.buffer).setUint32(0, headerBytes.length, true);
+  return new Blob([prefix, headerBytes, jpegBlob]);
+}
+
 function captureAndSend() {
   if (!videoEl || videoEl.readyState < 2 || videoEl.paused) return;
   
@@ -813,22 +827,24 @@ function captureAndSend() {
     canvas.height = h;
     const ctx = canvas.getContext('2d');
     ctx.drawImage(videoEl, 0, 0, w, h);
-    const dataUrl = canvas.toDataURL('image/jpeg', CAPTURE_QUALITY);
     
     frameCounter++;
+    const frameNumber = frameCounter;
     const message = {
       type: 'frame',
-      id: `frame_${frameCounter}_${Date.now()}`,
+      id: `frame_${frameNumber}_${Date.now()}`,
       videoId: new URLSearchParams(location.search).get('v') || 'unknown',
       ts: currentSecond,
-      frameB64: dataUrl,
       source: 'extension'  // Mark as extension source
     };
     
-    if (ws && ws.readyState === WebSocket.OPEN) {
-      ws.send(JSON.stringify(message));
-      console.log(`[DF EXT] 📤 Sent frame #${frameCounter} @ ${currentSecond}s`);
-    }
+    // JPEG is encoded off the main thread and sent as raw bytes after the header
+    canvas.toBlob((jpegBlob) => {
+      if (jpegBlob && ws && ws.readyState === WebSocket.OPEN) {
+        ws.send(buildFrameMessage(message, jpegBlob));
+        console.log(`[DF EXT] 📤 Sent frame #${frameNumber} @ ${currentSecond}s`);
+      }
+    }, 'image/jpeg', CAPTURE_QUALITY);
   } catch (err) {
     console.error('[DF EXT] Capture error:', err);
   }
@@ -1,14 +1,20 @@
 # native_host/server.py
 import asyncio
 import base64
-import json
-import io
+import hashlib
 import os
+import struct
 import sys
 import argparse
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from typing import Dict, Optional
 from datetime import datetime
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import time
 
 # Add parent directory to Python path to allow DeepfakeBench imports
@@ -19,14 +25,37 @@ if str(PROJECT_ROOT) not in sys.path:
 
 import cv2
 import numpy as np
-from PIL import Image
 import websockets
+import orjson
+try:
+    import uvloop  # libuv event loop for faster socket I/O; not available on Windows
+except ImportError:
+    uvloop = None
 import torch
 
 # IMPORTANT: adjust import path if demo_server.py is in a different folder
 from DeepfakeBench.training.demo_server import DeepfakeDetectionServer
 
 # Parse command-line arguments
+def percentage(value: str) -> float:
+    """argparse type: a number between 0 and 100"""
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a number")
+    if not 0 <= number <= 100:
+        raise argparse.ArgumentTypeError(f"{value} is not between 0 and 100")
+    return number
+
+def yes_no(value: str) -> bool:
+    """argparse type: yes/no (also y/n, true/false, 1/0)"""
+    answer = value.strip().lower()
+    if answer in ('y', 'yes', 'true', '1'):
+        return True
+    if answer in ('n', 'no', 'false', '0'):
+        return False
+    raise argparse.ArgumentTypeError(f"'{value}' is not yes or no")
+
 def parse_args():
     parser = argparse.ArgumentParser(description="WebSocket Deepfake Detection Server")
     parser.add_argument("--detector_config", default=None,
@@ -43,10 +72,53 @@ def parse_args():
                        help="WebSocket server host (default: 127.0.0.1)")
     parser.add_argument("--port", type=int, default=8765,
                        help="WebSocket server port (default: 8765)")
+    parser.add_argument("--detect_max_side", type=int, default=640,
+                       help="Longest frame side the face detector runs at; larger frames are downscaled for detection only (default: 640, 0 = full resolution)")
+    parser.add_argument("--dedup_distance", type=int, default=2,
+                       help="Reuse the last result of a video for frames whose 64-bit dHash differs in at most this many bits (default: 2, -1 = off)")
+    parser.add_argument("--max_batch", type=int, default=64,
+                       help="Most faces run through the models in one forward pass (default: 64)")
+    parser.add_argument("--max_wait_ms", type=float, default=8,
+                       help="Longest wait for more faces before running a batch (default: 8 ms)")
+    parser.add_argument("--compile", action='store_true',
+                       help="torch.compile the models (mode=reduce-overhead) and warm them up at startup")
+    parser.add_argument("--cuda_graphs", action='store_true',
+                       help="Capture each model's forward as CUDA graphs (one per batch size bucket) and replay them")
+    parser.add_argument("--engine", choices=['torch', 'onnxrt', 'trt'], default='torch',
+                       help="Inference engine: PyTorch, ONNX Runtime (CUDA) or ONNX Runtime with TensorRT (FP16) (default: torch)")
+    parser.add_argument("--fp32", action='store_true',
+                       help="Run the models in full FP32 precision instead of bf16 autocast")
+    parser.add_argument("--no_save_faces", action='store_true',
+                       help="Don't save preprocessed faces to disk (e.g. for throughput benchmarks)")
+    parser.add_argument("--fake_threshold", type=percentage, default=os.environ.get('DF_FAKE_THRESHOLD', '70'),
+                       help="FAKE predictions below this confidence %% are converted to REAL (default: $DF_FAKE_THRESHOLD or 70)")
+    parser.add_argument("--real_boost", type=percentage, default=os.environ.get('DF_REAL_BOOST', '25'),
+                       help="Confidence %% added to REAL predictions, capped at 100%% (default: $DF_REAL_BOOST or 25)")
+    parser.add_argument("--show_conversion_info", type=yes_no, default=os.environ.get('DF_SHOW_CONVERSION_INFO', 'yes'),
+                       help="Show conversion/boost details on the frontend: yes/no (default: $DF_SHOW_CONVERSION_INFO or yes)")
+    parser.add_argument("--interactive", action='store_true',
+                       help="Prompt for the three settings above at startup (only when stdin is a terminal)")
+    parser.add_argument("--log_every", type=int, default=30,
+                       help="Log per-frame details for every Nth frame of a client (default: 30, 1 = every frame)")
     return parser.parse_args()
 
 args = parse_args()
 
+# Frame handling logs through a queue that a listener thread writes to stdout, so the event
+# loop and worker threads never block on console I/O; per-frame details (received, decoded,
+# results table, ...) are only logged for the first and every LOG_EVERY-th frame of a client
+LOG_EVERY = max(1, args.log_every)
+log = logging.getLogger('df_server')
+log.setLevel(logging.INFO)
+log.propagate = False
+log_queue = queue.SimpleQueue()
+log.addHandler(QueueHandler(log_queue))
+log_listener = QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+log_listener.start()
+
+def is_logged_frame(client_frame_number: int) -> bool:
+    return client_frame_number == 1 or client_frame_number % LOG_EVERY == 0
+
 # CONFIG
 HOST = args.host
 PORT = args.port
@@ -56,6 +128,21 @@ BASE_DIR = PROJECT_ROOT  # Project root directory
 DETECTOR_CONFIG = args.detector_config or (BASE_DIR / 'DeepfakeBench' / 'training' / 'config' / 'detector' / 'effort.yaml')
 WEIGHTS_DIR = args.weights_dir or (BASE_DIR / 'DeepfakeBench' / 'training' / 'weights')
 
+# Numeric precision: TF32 Tensor Cores for FP32 matmuls and bf16 autocast for the model
+# forward on GPUs that support it
+torch.set_float32_matmul_precision("highest" if args.fp32 else "high")
+# cuDNN autotunes once per input shape. Batches come in any size up to --max_batch, so it is
+# only enabled when forwards are limited to the BATCH_BUCKETS sizes, all run at startup
+# (--compile pads batches to them, --cuda_graphs captures them); otherwise every new batch
+# size would be tuned while serving frames
+FIXED_BATCH_SHAPES = args.engine == 'torch' and (args.compile or args.cuda_graphs)
+torch.backends.cudnn.benchmark = FIXED_BATCH_SHAPES
+USE_AUTOCAST = torch.cuda.is_available() and torch.cuda.is_bf16_supported() and not args.fp32
+
+def inference_autocast():
+    """bf16 autocast context for model forwards (disabled on CPU or with --fp32)"""
+    return torch.autocast("cuda", dtype=torch.bfloat16, enabled=USE_AUTOCAST)
+
 # Determine mode: ensemble or single model
 ENSEMBLE_MODE = args.ensemble or (args.weights is None)
 SINGLE_WEIGHTS = args.weights
@@ -67,8 +154,15 @@ if isinstance(LANDMARK_MODEL, str):
     LANDMARK_MODEL = Path(LANDMARK_MODEL)
 
 # PREPROCESSED FACES SAVE DIRECTORY
+SAVE_FACES = not args.no_save_faces
 PREPROCESSED_FACES_DIR = BASE_DIR / 'DeepfakeBench' / 'saves_pipeline' / 'preprocessed_faces'
 
+# Faces are JPEG-encoded and written on these threads, off the inference path
+SAVE_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="save")
+# Writes queued or running on SAVE_POOL; past this, new saves are dropped so a slow disk can't pile up frames in memory
+SAVE_BACKLOG = 64
+SAVE_SLOTS = threading.BoundedSemaphore(SAVE_BACKLOG)
+
 # Create directory if it doesn't exist
 PREPROCESSED_FACES_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -84,97 +178,59 @@ print(f"[DF SERVER] Mode: {'ENSEMBLE' if ENSEMBLE_MODE else 'SINGLE MODEL'}")
 if not ENSEMBLE_MODE:
     print(f"[DF SERVER] Single Weights: {SINGLE_WEIGHTS}")
 print(f"[DF SERVER] Face Detection: {'ENABLED ✓' if USE_FACE_DETECTION else 'DISABLED'}")
-print(f"[DF SERVER] Preprocessed faces will be saved to: {PREPROCESSED_FACES_DIR}")
-
-# Interactive threshold configuration
-print("\n" + "="*80)
-print("⚙️  CONFIDENCE MECHANISM CONFIGURATION")
-print("="*80)
-
-# 1. FAKE→REAL Conversion Threshold
-print("\n1️⃣  FAKE→REAL CONVERSION THRESHOLD")
-print("   Current default: 70% (FAKE predictions below 70% confidence → converted to REAL)")
-print("   Would you like to adjust this threshold?")
-
-while True:
-    try:
-        user_input = input("   Enter threshold percentage (0-100) or press Enter for default [70]: ").strip()
-        
-        if user_input == "":
-            FAKE_THRESHOLD = 0.70
-            print(f"   ✓ Using default threshold: 70%")
-            break
-        
-        threshold_value = float(user_input)
-        
-        if 0 <= threshold_value <= 100:
-            FAKE_THRESHOLD = threshold_value / 100.0
-            print(f"   ✓ Threshold set to: {threshold_value}%")
-            break
-        else:
-            print("   ❌ Please enter a value between 0 and 100")
-    except ValueError:
-        print("   ❌ Invalid input. Please enter a number between 0 and 100")
-    except KeyboardInterrupt:
-        print("\n   ✓ Using default threshold: 70%")
-        FAKE_THRESHOLD = 0.70
-        break
-
-# 2. REAL Confidence Boost
-print("\n2️⃣  REAL PREDICTION CONFIDENCE BOOST")
-print("   Current default: +25% (REAL predictions get confidence boost, capped at 100%)")
-print("   Would you like to adjust this boost?")
-
-while True:
-    try:
-        user_input = input("   Enter boost percentage (0-100) or press Enter for default [25]: ").strip()
-        
-        if user_input == "":
-            REAL_BOOST = 0.25
-            print(f"   ✓ Using default boost: +25%")
-            break
-        
-        boost_value = float(user_input)
-        
-        if 0 <= boost_value <= 100:
-            REAL_BOOST = boost_value / 100.0
-            print(f"   ✓ Boost set to: +{boost_value}%")
-            break
-        else:
-            print("   ❌ Please enter a value between 0 and 100")
-    except ValueError:
-        print("   ❌ Invalid input. Please enter a number between 0 and 100")
-    except KeyboardInterrupt:
-        print("\n   ✓ Using default boost: +25%")
-        REAL_BOOST = 0.25
-        break
+print(f"[DF SERVER] Preprocessed faces will be saved to: {PREPROCESSED_FACES_DIR if SAVE_FACES else 'DISABLED'}")
 
-# 3. Show Conversion Info on Frontend
-print("\n3️⃣  FRONTEND DISPLAY SETTINGS")
-print("   Should the extension show conversion/boost information?")
-print("   → YES: Shows 'Converted from FAKE' and boost details (transparent)")
-print("   → NO: Hides conversion info (looks like natural predictions)")
+# Confidence mechanism: from the command line / environment, so the server starts headless
+# (containers, services); --interactive keeps the startup prompts for terminal use
+def prompt_percentage(prompt: str, default: float) -> float:
+    """Ask for a percentage until a valid one (or Enter for the default) is given"""
+    while True:
+        try:
+            user_input = input(f"   {prompt} (0-100) or press Enter for default [{default:g}]: ").strip()
+            return default if user_input == "" else percentage(user_input)
+        except argparse.ArgumentTypeError:
+            print("   ❌ Invalid input. Please enter a number between 0 and 100")
+        except (KeyboardInterrupt, EOFError):
+            print()
+            return default
 
-while True:
-    try:
-        user_input = input("   Show conversion info on frontend? (yes/no) [yes]: ").strip().lower()
-        
-        if user_input == "" or user_input in ['y', 'yes']:
-            SHOW_CONVERSION_INFO = True
-            print(f"   ✓ Conversion info will be shown on frontend")
-            break
-        elif user_input in ['n', 'no']:
-            SHOW_CONVERSION_INFO = False
-            print(f"   ✓ Conversion info will be hidden (natural display)")
-            break
-        else:
+def prompt_yes_no(prompt: str, default: bool) -> bool:
+    """Ask a yes/no question until answered (or Enter for the default)"""
+    while True:
+        try:
+            user_input = input(f"   {prompt} (yes/no) [{'yes' if default else 'no'}]: ").strip()
+            return default if user_input == "" else yes_no(user_input)
+        except argparse.ArgumentTypeError:
             print("   ❌ Please enter 'yes' or 'no'")
-    except KeyboardInterrupt:
-        print("\n   ✓ Conversion info will be shown on frontend")
-        SHOW_CONVERSION_INFO = True
-        break
+        except (KeyboardInterrupt, EOFError):
+            print()
+            return default
 
-print("="*80)
+if args.interactive and sys.stdin.isatty():
+    print("\n" + "="*80)
+    print("⚙️  CONFIDENCE MECHANISM CONFIGURATION")
+    print("="*80)
+    
+    print("\n1️⃣  FAKE→REAL CONVERSION THRESHOLD")
+    print("   FAKE predictions below this confidence are converted to REAL")
+    args.fake_threshold = prompt_percentage("Enter threshold percentage", args.fake_threshold)
+    
+    print("\n2️⃣  REAL PREDICTION CONFIDENCE BOOST")
+    print("   REAL predictions get this confidence boost, capped at 100%")
+    args.real_boost = prompt_percentage("Enter boost percentage", args.real_boost)
+    
+    print("\n3️⃣  FRONTEND DISPLAY SETTINGS")
+    print("   → YES: Shows 'Converted from FAKE' and boost details (transparent)")
+    print("   → NO: Hides conversion info (looks like natural predictions)")
+    args.show_conversion_info = prompt_yes_no("Show conversion info on frontend?", args.show_conversion_info)
+    
+    print("="*80)
+elif args.interactive:
+    print("[DF SERVER] --interactive ignored: stdin is not a terminal")
+
+FAKE_THRESHOLD = args.fake_threshold / 100.0
+REAL_BOOST = args.real_boost / 100.0
+SHOW_CONVERSION_INFO = args.show_conversion_info
 
 # Load detection server
 server_instance = DeepfakeDetectionServer(
@@ -195,6 +251,204 @@ print(f"   • FAKE→REAL threshold: {FAKE_THRESHOLD*100:.1f}% (FAKE prediction
 print(f"   • REAL confidence boost: +{REAL_BOOST*100:.1f}% (capped at 100%)")
 print(f"   • Frontend display: {'Show conversion details' if SHOW_CONVERSION_INFO else 'Hide conversion (natural)'}\n")
 
+# Model forwards run on one dedicated thread and CUDA stream: batches never contend for the
+# GPU, per-thread state (CUDA graphs) is reused, and the default executor stays free for
+# decoding and face detection
+infer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="infer")
+INFER_STREAM = torch.cuda.Stream() if torch.cuda.is_available() else None
+
+# Pinned host buffer each batch is assembled in, so its copy to the GPU is an async DMA
+# (zeroed: rows past a batch are sent along as padding, see batch_bucket)
+PINNED_INPUT = torch.zeros(args.max_batch, 3, 224, 224, pin_memory=True) if INFER_STREAM is not None else None
+
+# The scheduler sends batches of any size up to --max_batch. Compiled models and CUDA graphs
+# get them padded up to one of these sizes (powers of two), so only these shapes are ever
+# compiled or captured, all at startup
+BATCH_BUCKETS = sorted({min(1 << bit, args.max_batch) for bit in range(args.max_batch.bit_length() + 1)})
+
+def batch_bucket(count: int) -> int:
+    """Smallest batch bucket that holds count faces"""
+    return next(size for size in BATCH_BUCKETS if size >= count)
+
+# Device the models live on (same for all of them)
+INFER_DEVICE = next(next(iter(server_instance.models.values())).parameters()).device
+
+# A dummy forward per model (and batch size) compiles it (--compile) or builds its engine
+# (--engine) here instead of on the first client's frames
+def warm_up_model(model, device, batch_size: int = 1):
+    """One zero-image forward on the inference thread and stream"""
+    with torch.inference_mode(), torch.cuda.stream(INFER_STREAM), inference_autocast():
+        server_instance.inference(model, {
+            "image": torch.zeros(batch_size, 3, 224, 224, device=device),
+            "label": torch.zeros(batch_size, dtype=torch.long, device=device)
+        })
+
+# Optionally run the models with ONNX Runtime instead of PyTorch: 'onnxrt' uses its CUDA
+# provider, 'trt' its TensorRT provider (fused layers, FP16 kernels, engines cached on disk).
+# Each model is exported to ONNX once, into WEIGHTS_DIR/onnx.
+class OnnxExportWrapper(torch.nn.Module):
+    """Tensor in, (cls, prob) out view of a detector for torch.onnx.export"""
+    
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+    
+    def forward(self, image):
+        preds = self.model({"image": image}, inference=True)
+        return preds["cls"], preds["prob"]
+
+class OnnxRuntimeModel:
+    """Exported detector run by ONNX Runtime; called like the torch model by server_instance.inference"""
+    
+    def __init__(self, onnx_path: Path, providers: list):
+        self.session = onnxruntime.InferenceSession(str(onnx_path), providers=providers)
+    
+    def __call__(self, data_dict: Dict, inference: bool = True) -> Dict:
+        image = data_dict["image"].float().contiguous()
+        cls_out = torch.empty(image.shape[0], 2, device=image.device)
+        prob = torch.empty(image.shape[0], device=image.device)
+        if image.is_cuda:
+            # ONNX Runtime works on its own stream, so the input copy has to be done first
+            torch.cuda.current_stream().synchronize()
+        
+        # Inputs and outputs stay in the torch tensors' memory, no host round-trip
+        binding = self.session.io_binding()
+        device_type, device_id = image.device.type, image.device.index or 0
+        binding.bind_input("image", device_type, device_id, np.float32, tuple(image.shape), image.data_ptr())
+        binding.bind_output("cls", device_type, device_id, np.float32, tuple(cls_out.shape), cls_out.data_ptr())
+        binding.bind_output("prob", device_type, device_id, np.float32, tuple(prob.shape), prob.data_ptr())
+        self.session.run_with_iobinding(binding)
+        return {"cls": cls_out, "prob": prob}
+
+if args.engine != 'torch':
+    try:
+        import onnxruntime
+    except ImportError:
+        raise SystemExit(f"--engine {args.engine} needs ONNX Runtime. Install with: pip install onnxruntime-gpu")
+    
+    onnx_dir = Path(WEIGHTS_DIR) / 'onnx'
+    onnx_dir.mkdir(parents=True, exist_ok=True)
+    if args.engine == 'trt':
+        providers = [('TensorrtExecutionProvider', {
+            'trt_fp16_enable': True,
+            'trt_engine_cache_enable': True,
+            'trt_engine_cache_path': str(onnx_dir),
+            'trt_profile_min_shapes': 'image:1x3x224x224',
+            'trt_profile_opt_shapes': f'image:{args.max_batch}x3x224x224',
+            'trt_profile_max_shapes': f'image:{args.max_batch}x3x224x224'
+        }), 'CUDAExecutionProvider', 'CPUExecutionProvider']
+    else:
+        providers = ['CUDAExecutionProvider', 'CPUExecutionProvider']
+    
+    print(f"[DF SERVER] Preparing {args.engine} engines in {onnx_dir}...")
+    for model_name in list(server_instance.models):
+        # Single-model weights can be any file, so their export is named after it. The name
+        # also carries a fingerprint of the files the model was built from (detector config,
+        # weights, shared backbone weights): updated weights get a new export, and a new
+        # TensorRT engine, since ONNX Runtime keys its engine cache by model path
+        export_name = Path(SINGLE_WEIGHTS).stem if not ENSEMBLE_MODE else model_name
+        source_files = [Path(DETECTOR_CONFIG)] + [Path(path) for path in server_instance.weight_files[model_name]]
+        fingerprint = hashlib.sha1('|'.join(
+            f"{path.resolve()}:{path.stat().st_size}:{path.stat().st_mtime_ns}" for path in source_files
+        ).encode()).hexdigest()[:12]
+        onnx_path = onnx_dir / f"{export_name}-{fingerprint}.onnx"
+        engine_start = time.time()
+        if not onnx_path.exists():
+            # Exports of earlier weights are never used again
+            for stale_path in onnx_dir.glob(f"{export_name}-{'?' * len(fingerprint)}.onnx"):
+                stale_path.unlink()
+            torch.onnx.export(
+                OnnxExportWrapper(server_instance.models[model_name]),
+                torch.zeros(1, 3, 224, 224, device=INFER_DEVICE),
+                str(onnx_path),
+                input_names=['image'],
+                output_names=['cls', 'prob'],
+                dynamic_axes={'image': {0: 'batch'}, 'cls': {0: 'batch'}, 'prob': {0: 'batch'}},
+                opset_version=17
+            )
+        
+        model = OnnxRuntimeModel(onnx_path, providers)
+        server_instance.models[model_name] = model
+        infer_executor.submit(warm_up_model, model, INFER_DEVICE).result()
+        print(f"   ✓ {model_name} ready ({onnx_path.name}, {time.time() - engine_start:.1f}s)")
+
+elif args.compile:
+    print(f"[DF SERVER] Compiling models with torch.compile (mode=reduce-overhead) for batch sizes {BATCH_BUCKETS}...")
+    # One static specialization (and CUDA graph) per bucket instead of a dynamic-shape graph
+    torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, len(BATCH_BUCKETS) + 1)
+    for model_name in list(server_instance.models):
+        model = torch.compile(server_instance.models[model_name], mode="reduce-overhead", dynamic=False)
+        server_instance.models[model_name] = model
+        
+        compile_start = time.time()
+        for batch_size in BATCH_BUCKETS:
+            infer_executor.submit(warm_up_model, model, INFER_DEVICE, batch_size).result()
+        print(f"   ✓ {model_name} compiled ({time.time() - compile_start:.1f}s)")
+
+# Optionally capture the (torch, uncompiled) forwards as CUDA graphs: the input shape only
+# varies in batch size, so one graph per power-of-two bucket up to --max_batch is replayed
+# with the batch padded up to its bucket, instead of launching every kernel from Python
+class CudaGraphModel:
+    """Detector forward replayed from CUDA graphs; called like the torch model by server_instance.inference"""
+    
+    def __init__(self, model, device):
+        self.graphs = {}
+        pool = torch.cuda.graph_pool_handle()  # Replays are serialized per model, so the buckets share memory
+        
+        # Largest first, so the smaller captures fit in the memory it already reserved
+        for size in reversed(BATCH_BUCKETS):
+            data = {"image": torch.zeros(size, 3, 224, 224, device=device),
+                    "label": torch.zeros(size, dtype=torch.long, device=device)}
+            
+            # Warm-up forwards (lazy init, cuBLAS workspaces) have to run on a side stream before capture
+            side_stream = torch.cuda.Stream()
+            side_stream.wait_stream(torch.cuda.current_stream())
+            with torch.inference_mode(), torch.cuda.stream(side_stream), inference_autocast():
+                for _ in range(3):
+                    model(data, inference=True)
+            torch.cuda.current_stream().wait_stream(side_stream)
+            
+            graph = torch.cuda.CUDAGraph()
+            with torch.inference_mode(), torch.cuda.graph(graph, pool=pool), inference_autocast():
+                preds = model(data, inference=True)
+            self.graphs[size] = (graph, data["image"], preds["cls"], preds["prob"])
+    
+    def __call__(self, data_dict: Dict, inference: bool = True) -> Dict:
+        image = data_dict["image"]
+        count = image.shape[0]
+        graph, static_image, static_cls, static_prob = self.graphs[batch_bucket(count)]
+        
+        # Padding rows keep whatever the last replay left there; faces are independent
+        static_image[:count].copy_(image)
+        graph.replay()
+        # The next replay overwrites the static outputs
+        return {"cls": static_cls[:count].clone(), "prob": static_prob[:count].clone()}
+
+if args.cuda_graphs:
+    if args.engine != 'torch' or args.compile:
+        print("[DF SERVER] --cuda_graphs ignored: only applies to the plain torch engine (--compile already uses CUDA graphs)")
+    elif INFER_STREAM is None:
+        print("[DF SERVER] --cuda_graphs ignored: CUDA is not available")
+    else:
+        print("[DF SERVER] Capturing CUDA graphs...")
+        for model_name in list(server_instance.models):
+            capture_start = time.time()
+            model = infer_executor.submit(CudaGraphModel, server_instance.models[model_name], INFER_DEVICE).result()
+            server_instance.models[model_name] = model
+            print(f"   ✓ {model_name} captured for batch sizes {BATCH_BUCKETS} ({time.time() - capture_start:.1f}s)")
+
+# Batches are padded to BATCH_BUCKETS for compiled models (CUDA graph models pad themselves)
+PAD_BATCHES = args.compile and args.engine == 'torch'
+
+# The model set is fixed from here on (compiled models, graphs and engines included): looked up once, not per frame
+MODEL_ITEMS = list(server_instance.models.items())
+MODEL_NAMES = [model_name for model_name, _ in MODEL_ITEMS]
+IS_SINGLE_MODEL = len(MODEL_ITEMS) == 1
+
+# Ensemble models are independent forwards over the same input: each gets its own CUDA stream
+# so they run concurrently and fill the GPU instead of queueing one after another
+MODEL_STREAMS = [torch.cuda.Stream() for _ in MODEL_ITEMS] if INFER_STREAM is not None and not IS_SINGLE_MODEL else None
+
 # Statistics tracking
 frame_count = 0
 session_start_time = None
@@ -206,29 +460,74 @@ def b64_to_bgr_img(data_url: str) -> np.ndarray:
         _, encoded = data_url.split(',', 1)
     else:
         encoded = data_url
-    img_bytes = base64.b64decode(encoded)
-    img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
-    arr = np.array(img)
-    bgr = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
+    # libjpeg-turbo decodes straight to BGR, no PIL image or RGB copy in between
+    return jpeg_bytes_to_bgr_img(base64.b64decode(encoded))
+
+# Helper: split a binary frame message (<uint32 header length><JSON header><JPEG bytes>)
+def unpack_binary_frame(raw: bytes):
+    (header_len,) = struct.unpack_from('<I', raw, 0)
+    payload = memoryview(raw)
+    header = orjson.loads(payload[4:4 + header_len])
+    return header, payload[4 + header_len:]
+
+# Helper: send a JSON reply; orjson builds the UTF-8 bytes directly (NumPy arrays included)
+# and they go out as a text frame, as json.dumps strings did
+async def send_json(ws, data: Dict) -> None:
+    await ws.send(orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY), text=True)
+
+# Helper: decode raw JPEG bytes into BGR numpy image
+def jpeg_bytes_to_bgr_img(img_bytes) -> np.ndarray:
+    bgr = cv2.imdecode(np.frombuffer(img_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if bgr is None:
+        raise ValueError('invalid JPEG data')
     return bgr
 
-# Helper: detect face bbox (normalized) using dlib
-def detect_face_bbox_normalized(img_bgr: np.ndarray) -> Optional[list]:
-    """Detect face bounding box using dlib face detector"""
-    if server_instance.face_detector is None:
-        return None
+# Reusable preprocessing buffers: every frame needs the same (1, 3, 224, 224) float32 face
+# array, so arrays go back to a per-shape free list once the batch has copied them out instead
+# of being reallocated (and garbage collected) 30 times a second per client
+class FrameBufferPool:
+    """Free lists of np.ndarray buffers keyed by (shape, dtype); safe to share across threads"""
     
-    rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-    # Changed upsample from 1 to 0 for faster detection (less accurate but much faster)
-    faces = server_instance.face_detector(rgb, 0)
+    def __init__(self, max_free: int):
+        self.max_free = max_free
+        self.free = {}
     
-    if not faces:
-        return None
+    def get(self, shape: tuple, dtype=np.float32) -> np.ndarray:
+        """A buffer of this shape and dtype, reused when one was released (contents undefined)"""
+        free_list = self.free.get((shape, np.dtype(dtype)))
+        if free_list:
+            try:
+                return free_list.pop()
+            except IndexError:  # Emptied by another thread since the check
+                pass
+        return np.empty(shape, dtype=dtype)
     
-    # Get largest face
-    face = max(faces, key=lambda r: r.width() * r.height())
+    def release(self, buffer: np.ndarray):
+        """Hand a buffer back once nothing reads it anymore"""
+        free_list = self.free.setdefault((buffer.shape, buffer.dtype), deque())
+        if len(free_list) < self.max_free:
+            free_list.append(buffer)
+
+# Enough free faces for the batch in flight and the one being filled
+FACE_BUFFERS = FrameBufferPool(max_free=2 * args.max_batch)
+
+# Helper: 64-bit difference hash of a frame (gradient signs of a 9x8 grayscale thumbnail);
+# frames that look alike differ in only a few bits
+def dhash(img_bgr: np.ndarray) -> int:
+    thumbnail = cv2.cvtColor(cv2.resize(img_bgr, (9, 8), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return int.from_bytes(np.packbits(thumbnail[:, 1:] > thumbnail[:, :-1]).tobytes(), 'big')
+
+# Each connection keeps the last analyzed (hash, response) per video, least recently used
+# first: video ids come from the client ('public_upload', 'web_upload', ...), so a cache shared
+# between connections would answer one user's frames with another user's result
+DEDUP_DISTANCE = args.dedup_distance
+DEDUP_CACHE_SIZE = 64
+
+# Helper: face bbox (normalized) from the dlib rectangle the face was aligned from
+def face_rect_to_bbox_normalized(face, img_shape) -> Optional[list]:
+    """Normalize a dlib face rectangle to [x, y, width, height] in 0-1 image coordinates"""
     x1, y1, x2, y2 = face.left(), face.top(), face.right(), face.bottom()
-    h, w = img_bgr.shape[:2]
+    h, w = img_shape[:2]
     
     # Ensure bbox is within image bounds
     x1, y1 = max(0, x1), max(0, y1)
@@ -245,113 +544,246 @@ def detect_face_bbox_normalized(img_bgr: np.ndarray) -> Optional[list]:
     
     return [bx, by, bw, bh]
 
+# Helper: write a face image (runs on SAVE_POOL)
+def write_face_image(filepath: Path, face_aligned: np.ndarray):
+    try:
+        filepath.parent.mkdir(exist_ok=True)
+        cv2.imwrite(str(filepath), face_aligned)
+    except Exception as e:
+        log.error(f"❌ [DF SERVER] Failed to save face {filepath.name}: {e}")
+    finally:
+        SAVE_SLOTS.release()
+
 # Helper: save preprocessed face
-def save_preprocessed_face(face_aligned: np.ndarray, video_id: str, frame_id: str, timestamp: int) -> str:
+def save_preprocessed_face(face_aligned: np.ndarray, video_id: str, frame_id: str, timestamp: int) -> Optional[str]:
     """
-    Save preprocessed/aligned face to disk
-    Returns: saved file path
+    Save preprocessed/aligned face to disk; the write itself happens on SAVE_POOL
+    Returns: saved file path (None when saving is disabled or the write backlog is full)
     """
     global saved_faces_count
     
-    # Create subdirectory for this video
-    video_dir = PREPROCESSED_FACES_DIR / video_id
-    video_dir.mkdir(exist_ok=True)
+    if not SAVE_FACES:
+        return None
     
-    # Create filename: videoID_frameID_timestamp_YYYYMMDD_HHMMSS.jpg
+    # Create filename in this video's subdirectory: videoID_frameID_timestamp_YYYYMMDD_HHMMSS.jpg
     timestamp_str = datetime.now().strftime('%Y%m%d_%H%M%S')
     filename = f"{video_id}_{frame_id}_t{timestamp}s_{timestamp_str}.jpg"
-    filepath = video_dir / filename
+    filepath = PREPROCESSED_FACES_DIR / video_id / filename
     
-    # Save face image
-    cv2.imwrite(str(filepath), face_aligned)
+    if not SAVE_SLOTS.acquire(blocking=False):
+        log.warning(f"⚠️  [DF SERVER] Save backlog full ({SAVE_BACKLOG} pending), dropping face {filename}")
+        return None
+    
+    # Save face image (the array isn't modified after this, so no copy is needed)
+    SAVE_POOL.submit(write_face_image, filepath, face_aligned)
     saved_faces_count += 1
     
     return str(filepath)
 
-# Inference wrapper with timing and face extraction + SAVING
-@torch.inference_mode()
-def infer_using_server(img_bgr: np.ndarray, video_id: str, frame_id: str, timestamp: int) -> Dict:
+# Face extraction + SAVING + preprocessing (runs in the executor, one frame at a time)
+def prepare_face(img_bgr: np.ndarray, video_id: str, frame_id: str, timestamp: int) -> Dict:
     """
-    Run inference on image with face detection, alignment, and SAVING.
+    Run face detection, alignment, and SAVING, then preprocess the face for the models.
     
     Returns:
-        Dictionary with model predictions, timing info, face bbox, and saved path
+        Dictionary with the (1, 3, 224, 224) face tensor, timing info, face bbox, and saved path
     """
     face_aligned = None
     timing_info = {}
     bbox_norm = None
     saved_face_path = None
     
-    try:
-        # Face detection and alignment
-        face_start = time.time()
+    # Face detection and alignment
+    face_start = time.time()
+    
+    if server_instance.face_detector and server_instance.landmark_predictor:
+        # Extract aligned face using landmarks (same as demo_server.py)
+        face_aligned, face_rect = server_instance.extract_aligned_face(img_bgr, res=224, max_detect_side=args.detect_max_side)
         
-        if server_instance.face_detector and server_instance.landmark_predictor:
-            # Extract aligned face using landmarks (same as demo_server.py)
-            face_aligned = server_instance.extract_aligned_face(img_bgr, res=224)
-            
-            if face_aligned is None:
-                return {'error': 'No face detected'}
-            
-            # *** SAVE PREPROCESSED FACE ***
-            saved_face_path = save_preprocessed_face(face_aligned, video_id, frame_id, timestamp)
-            
-            # Also get bbox for visualization
-            bbox_norm = detect_face_bbox_normalized(img_bgr)
+        if face_aligned is None:
+            return {'error': 'No face detected'}
+        
+        # *** SAVE PREPROCESSED FACE ***
+        saved_face_path = save_preprocessed_face(face_aligned, video_id, frame_id, timestamp)
+        
+        # Also get bbox for visualization (from the same detection, no second dlib pass)
+        bbox_norm = face_rect_to_bbox_normalized(face_rect, img_bgr.shape)
+    else:
+        # No face detection - use entire image
+        face_aligned = img_bgr
+        bbox_norm = None
+        # Still save the "face" (full image)
+        saved_face_path = save_preprocessed_face(face_aligned, video_id, frame_id, timestamp)
+    
+    timing_info['face_detection'] = time.time() - face_start
+
+    # Preprocessing (stays on the CPU; the batch is moved to the GPU as a whole)
+    prep_start = time.time()
+    face_tensor = server_instance.preprocess_face(face_aligned, out=FACE_BUFFERS.get((1, 3, 224, 224)))
+    timing_info['preprocessing'] = time.time() - prep_start
+    
+    return {'face_tensor': face_tensor, '_timing': timing_info, '_bbox': bbox_norm, '_saved_face_path': saved_face_path}
+
+# Model forward for a batch of faces (runs on infer_executor, one batch at a time)
+@torch.inference_mode()
+def forward_batch(face_tensors: list) -> list:
+    """
+    Run every model once on the stacked face tensors, on INFER_STREAM (ensemble models each on
+    their own stream in MODEL_STREAMS, joined back before the read-back).
+    
+    Returns:
+        One {model_name: (cls, prob, inference_time)} dictionary per face, in input order;
+        inference_time is the forward time of the whole batch
+    """
+    outputs = [{} for _ in face_tensors]
+    
+    with torch.cuda.stream(INFER_STREAM):
+        # Compiled models only run the shapes they were compiled for: pad to the batch bucket
+        # (padding rows' outputs are never read)
+        count = len(face_tensors)
+        padded_count = batch_bucket(count) if PAD_BATCHES else count
+        
+        # The pinned buffer can be refilled by the next batch: the .cpu() read below waits
+        # for this stream, copy included
+        if PINNED_INPUT is not None:
+            torch.cat(face_tensors, 0, out=PINNED_INPUT[:count])
+            host_images = PINNED_INPUT[:padded_count]
         else:
-            # No face detection - use entire image
-            face_aligned = img_bgr
-            bbox_norm = None
-            # Still save the "face" (full image)
-            saved_face_path = save_preprocessed_face(face_aligned, video_id, frame_id, timestamp)
+            host_images = torch.cat(face_tensors + [torch.zeros(padded_count - count, 3, 224, 224)], 0)
+        # The faces are copied into the batch: their buffers can take the next frames
+        for face_tensor in face_tensors:
+            FACE_BUFFERS.release(face_tensor.numpy())
+        images = host_images.to(INFER_DEVICE, non_blocking=True)
+        data = {"image": images, "label": torch.zeros(padded_count, dtype=torch.long, device=INFER_DEVICE)}
         
-        timing_info['face_detection'] = time.time() - face_start
+        # Queue every model's forward first, then read all outputs back in one copy, so the
+        # stream is synchronized once per batch instead of twice per model
+        forward_start = time.time()
+        device_outputs = []
+        for model_index, (_, model) in enumerate(MODEL_ITEMS):
+            model_stream = MODEL_STREAMS[model_index] if MODEL_STREAMS is not None else None
+            if model_stream is not None:
+                # Start after the input copy; the caching allocator must not hand the input
+                # memory back to INFER_STREAM while this stream still reads it
+                model_stream.wait_stream(INFER_STREAM)
+                images.record_stream(model_stream)
+                data["label"].record_stream(model_stream)
+            with torch.cuda.stream(model_stream), inference_autocast():
+                preds = server_instance.inference(model, data)
+                # [cls logits, prob] per face, back in FP32 for the threshold math (NumPy has no bf16)
+                model_output = torch.cat([preds["cls"].float(), preds["prob"].float().unsqueeze(1)], 1)
+            if model_stream is not None:
+                INFER_STREAM.wait_stream(model_stream)
+                model_output.record_stream(INFER_STREAM)
+            device_outputs.append(model_output)
+        host_outputs = torch.stack(device_outputs).cpu().numpy()  # (models, faces, 3)
+        forward_time = time.time() - forward_start
+    
+    for model_name, model_output in zip(MODEL_NAMES, host_outputs):
+        for output, row in zip(outputs, model_output):
+            output[model_name] = (row[:2], row[2], forward_time)
+    return outputs
+
+class BatchScheduler:
+    """
+    Dynamic micro-batching of model forwards across all frames and clients: faces are
+    queued and run together once max_batch of them are waiting or max_wait_ms after the
+    first one arrived. Faces arriving while a batch runs on the GPU form the next batch.
+    """
+    
+    def __init__(self, max_batch: int = 64, max_wait_ms: float = 8):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.worker = None
+    
+    def start(self):
+        self.worker = asyncio.create_task(self.run())
+    
+    async def submit(self, face_tensor) -> Dict:
+        """Queue one face tensor and wait for its {model_name: (cls, prob, inference_time)}"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((face_tensor, future))
+        return await future
+    
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                outputs = await loop.run_in_executor(infer_executor, forward_batch, [face_tensor for face_tensor, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output)
+
+# Created in main() once the event loop is running
+batch_scheduler = None
 
-        # Preprocessing
-        prep_start = time.time()
-        face_tensor = server_instance.preprocess_face(face_aligned).to(
-            next(iter(server_instance.models.values())).parameters().__next__().device
-        )
-        data = {"image": face_tensor, "label": torch.tensor([0]).to(face_tensor.device)}
-        timing_info['preprocessing'] = time.time() - prep_start
+# Inference wrapper with timing and face extraction + SAVING
+async def infer_using_server(img_bgr: np.ndarray, video_id: str, frame_id: str, timestamp: int) -> Dict:
+    """
+    Run inference on image with face detection, alignment, and SAVING.
+    Face extraction runs in the executor; the model forward goes through batch_scheduler.
+    
+    Returns:
+        Dictionary with model predictions, timing info, face bbox, and saved path
+    """
+    loop = asyncio.get_running_loop()
+    
+    try:
+        face = await loop.run_in_executor(None, prepare_face, img_bgr, video_id, frame_id, timestamp)
+        if 'error' in face:
+            return face
+        
+        timing_info = face['_timing']
 
         # Model inference
         inference_start = time.time()
+        model_outputs = await batch_scheduler.submit(face['face_tensor'])
         results = {}
         
-        # Check if single model mode
-        is_single_model = len(server_instance.models) == 1
-        
-        for model_name, model in server_instance.models.items():
-            model_start = time.time()
-            preds = server_instance.inference(model, data)
-            cls_out = preds["cls"].squeeze().cpu().numpy()
-            prob = preds["prob"].squeeze().cpu().numpy()
+        for model_name, (cls_out, prob, model_time) in model_outputs.items():
+            # One Python float per model: NumPy scalar comparisons/arithmetic each allocate
+            prob = float(prob)
             pred_label = "FAKE" if prob >= 0.5 else "REAL"
-            confidence = float(prob) if prob >= 0.5 else float(1 - prob)
-            
-            model_time = time.time() - model_start
+            confidence = prob if prob >= 0.5 else 1 - prob
             
             # Apply confidence threshold for single model mode
-            if is_single_model:
+            if IS_SINGLE_MODEL:
                 final_pred, final_conf, was_converted = server_instance._apply_confidence_threshold(
                     prob, pred_label, confidence, is_single_model=True
                 )
                 
                 results[model_name] = {
-                    'cls': cls_out.tolist() if hasattr(cls_out, 'tolist') else int(cls_out),
-                    'prob': float(prob),
+                    'cls': cls_out,
+                    'prob': prob,
                     'prediction': final_pred,
                     'confidence': float(final_conf),
                     'original_prediction': pred_label,
-                    'original_confidence': float(confidence),
+                    'original_confidence': confidence,
                     'was_converted': was_converted,
                     'inference_time': model_time
                 }
             else:
                 results[model_name] = {
-                    'cls': cls_out.tolist() if hasattr(cls_out, 'tolist') else int(cls_out),
-                    'prob': float(prob),
+                    'cls': cls_out,
+                    'prob': prob,
                     'prediction': pred_label,
                     'confidence': confidence,
                     'inference_time': model_time
@@ -360,15 +792,15 @@ def infer_using_server(img_bgr: np.ndarray, video_id: str, frame_id: str, timest
         timing_info['inference'] = time.time() - inference_start
 
         # Ensemble voting (using custom logic from demo_server.py)
-        if len(server_instance.models) > 1:
+        if not IS_SINGLE_MODEL:
             ensemble_result = server_instance._calculate_ensemble_verdict(results)
             results['ENSEMBLE'] = ensemble_result
 
         # Add timing, bbox, and saved path info
         results['_timing'] = timing_info
         results['_timing']['total'] = sum(timing_info.values())
-        results['_bbox'] = bbox_norm
-        results['_saved_face_path'] = saved_face_path
+        results['_bbox'] = face['_bbox']
+        results['_saved_face_path'] = face['_saved_face_path']
 
         return results
 
@@ -378,25 +810,22 @@ def infer_using_server(img_bgr: np.ndarray, video_id: str, frame_id: str, timest
 def print_frame_analysis(frame_num: int, video_id: str, timestamp: int, results: Dict, bbox: Optional[list], saved_path: Optional[str]):
     """Print detailed frame analysis like demo_server.py"""
     
-    # Check if single model mode
-    is_single_model = len(server_instance.models) == 1
-    
     # Print separator for first frame
     if frame_num == 1:
-        print("\n" + "="*140)
-        print(f"📹 Video ID: {video_id or 'Unknown'}")
-        print(f"💾 Saving faces to: {PREPROCESSED_FACES_DIR / video_id}")
-        print("="*140)
+        log.info("\n" + "="*140)
+        log.info(f"📹 Video ID: {video_id or 'Unknown'}")
+        log.info(f"💾 Saving faces to: {PREPROCESSED_FACES_DIR / video_id}")
+        log.info("="*140)
         
-        if is_single_model:
+        if IS_SINGLE_MODEL:
             # Single model mode header
-            model_name = list(server_instance.models.keys())[0]
-            print(f"\n{'Frame':<8} {'Time':<10} {model_name:<30} {'Status':<25} {'Process Time':<15}")
-            print("-"*140)
+            model_name = MODEL_NAMES[0]
+            log.info(f"\n{'Frame':<8} {'Time':<10} {model_name:<30} {'Status':<25} {'Process Time':<15}")
+            log.info("-"*140)
         else:
             # Ensemble mode header
-            print(f"\n{'Frame':<8} {'Time':<10} {'FaceForensics':<22} {'SDv14':<22} {'Chameleon':<22} {'ENSEMBLE':<22} {'Process Time':<15}")
-            print("-"*140)
+            log.info(f"\n{'Frame':<8} {'Time':<10} {'FaceForensics':<22} {'SDv14':<22} {'Chameleon':<22} {'ENSEMBLE':<22} {'Process Time':<15}")
+            log.info("-"*140)
     
     # Format predictions
     def fmt_pred(model_name):
@@ -424,9 +853,9 @@ def print_frame_analysis(frame_num: int, video_id: str, timestamp: int, results:
     time_label = f"{timestamp}s"
     time_disp = f"{total_time:.3f}s"
     
-    if is_single_model:
+    if IS_SINGLE_MODEL:
         # Single model display with conversion status
-        model_name = list(server_instance.models.keys())[0]
+        model_name = MODEL_NAMES[0]
         model_disp = fmt_pred(model_name)
         
         # Show conversion status
@@ -437,35 +866,211 @@ def print_frame_analysis(frame_num: int, video_id: str, timestamp: int, results:
         else:
             status = ""
         
-        print(f"{frame_label:<8} {time_label:<10} {model_disp:<30} {status:<25} {time_disp:<15}")
+        log.info(f"{frame_label:<8} {time_label:<10} {model_disp:<30} {status:<25} {time_disp:<15}")
     else:
         # Ensemble display
         ff_disp = fmt_pred('FaceForensics')
         sd_disp = fmt_pred('SDv14')
         ch_disp = fmt_pred('Chameleon')
         ens_disp = fmt_pred('ENSEMBLE')
-        print(f"{frame_label:<8} {time_label:<10} {ff_disp:<22} {sd_disp:<22} {ch_disp:<22} {ens_disp:<22} {time_disp:<15}")
+        log.info(f"{frame_label:<8} {time_label:<10} {ff_disp:<22} {sd_disp:<22} {ch_disp:<22} {ens_disp:<22} {time_disp:<15}")
     
     # Print saved face path
     if saved_path:
-        print(f"   💾 Saved: {Path(saved_path).name}")
+        log.info(f"   💾 Saved: {Path(saved_path).name}")
     
     # Print detailed breakdown every 10 frames
     if frame_num % 10 == 0:
-        print(f"\n   📊 Last 10 frames breakdown:")
-        print(f"      • Face Detection: {timing.get('face_detection', 0):.3f}s")
-        print(f"      • Preprocessing: {timing.get('preprocessing', 0):.3f}s")
-        print(f"      • Model Inference: {timing.get('inference', 0):.3f}s")
-        print(f"      • Total: {total_time:.3f}s")
-        print(f"      • Faces Saved: {saved_faces_count}")
-        print()
+        log.info(f"\n   📊 Last 10 frames breakdown:")
+        log.info(f"      • Face Detection: {timing.get('face_detection', 0):.3f}s")
+        log.info(f"      • Preprocessing: {timing.get('preprocessing', 0):.3f}s")
+        log.info(f"      • Model Inference: {timing.get('inference', 0):.3f}s")
+        log.info(f"      • Total: {total_time:.3f}s")
+        log.info(f"      • Faces Saved: {saved_faces_count}")
+        log.info("")
 
 def print_session_stats():
     """Print session statistics"""
     if session_start_time and frame_count > 0:
         elapsed = time.time() - session_start_time
         fps = frame_count / elapsed if elapsed > 0 else 0
-        print(f"\n📊 Session Stats: {frame_count} frames processed | {saved_faces_count} faces saved | {fps:.2f} FPS | {elapsed:.1f}s elapsed")
+        log.info(f"\n📊 Session Stats: {frame_count} frames processed | {saved_faces_count} faces saved | {fps:.2f} FPS | {elapsed:.1f}s elapsed")
+
+# Decode one frame message, run inference and build the response for it
+async def analyze_frame(msg: Dict, frame_bytes, client_frame_number: int, recent_frames: OrderedDict) -> Dict:
+    """Returns a 'result' (or NO_FACE result) dict, or an 'error' dict; recent_frames is the connection's dedup cache"""
+    global frame_count
+    
+    frame_count += 1
+    log_frame = is_logged_frame(client_frame_number)
+    
+    frame_id = msg.get('id', 'unknown')
+    video_id = msg.get('videoId', 'unknown')
+    timestamp = msg.get('ts', 0)
+    frame_b64 = msg.get('frameB64')
+    
+    # Get source flag and upload metadata
+    source = msg.get('source', 'extension')
+    current_frame = msg.get('currentFrame', 0)
+    total_frames = msg.get('totalFrames', 0)
+    video_duration = msg.get('videoDuration', 0)
+    
+    if log_frame:
+        log.info(f"\n📥 [DF SERVER] Received frame #{client_frame_number} (ID: {frame_id[:8]}...) from {source} - video {video_id} @ {timestamp}s")
+    
+    if not frame_b64 and frame_bytes is None:
+        log.warning(f"❌ [DF SERVER] No frame data provided")
+        return {'type': 'error', 'error': 'no frame provided'}
+
+    # Decode frame
+    decode_start = time.time()
+    try:
+        if frame_bytes is not None:
+            img_bgr = jpeg_bytes_to_bgr_img(frame_bytes)
+        else:
+            img_bgr = b64_to_bgr_img(frame_b64)
+        decode_time = time.time() - decode_start
+        if log_frame:
+            log.info(f"   ✓ Frame decoded: {img_bgr.shape[1]}x{img_bgr.shape[0]} ({decode_time:.3f}s)")
+    except Exception as e:
+        log.warning(f"❌ [DF SERVER] Failed to decode frame: {e}")
+        return {'type': 'error', 'error': f'failed to decode frame: {e}'}
+
+    # Near-duplicate of the last analyzed frame of this video (paused or static scene):
+    # reuse its result instead of running face detection and the models again
+    frame_hash = dhash(img_bgr) if DEDUP_DISTANCE >= 0 else None
+    cached = recent_frames.get(video_id) if frame_hash is not None else None
+    if cached is not None and bin(frame_hash ^ cached[0]).count('1') <= DEDUP_DISTANCE:
+        recent_frames.move_to_end(video_id)
+        resp = {**cached[1], 'id': msg.get('id'), 'ts': msg.get('ts')}
+        if log_frame:
+            log.info(f"   ♻️  Near-duplicate of the last analyzed frame: reusing its result ({resp['prediction']})")
+    else:
+        resp = await infer_frame(msg, img_bgr, client_frame_number, log_frame)
+        if resp.get('type') != 'result':
+            return resp
+        if frame_hash is not None:
+            # A copy: the progress fields below belong to this frame only
+            recent_frames[video_id] = (frame_hash, dict(resp))
+            recent_frames.move_to_end(video_id)
+            if len(recent_frames) > DEDUP_CACHE_SIZE:
+                recent_frames.popitem(last=False)
+    
+    if resp['prediction'] == 'NO_FACE':
+        return resp
+    
+    # Add progress info for web uploads
+    if source == 'web_upload' and total_frames > 0:
+        progress_percent = (current_frame / total_frames) * 100
+        current_second = int(timestamp)
+        total_seconds = int(video_duration)
+        
+        resp['progress'] = progress_percent
+        resp['currentFrame'] = current_frame
+        resp['totalFrames'] = total_frames
+        resp['currentSecond'] = current_second
+        resp['totalSeconds'] = total_seconds
+        resp['isComplete'] = current_frame >= total_frames
+        
+        if log_frame:
+            log.info(f"   📊 Progress: {progress_percent:.1f}% ({current_second}s / {total_seconds}s)")
+    
+    return resp
+
+async def infer_frame(msg: Dict, img_bgr: np.ndarray, client_frame_number: int, log_frame: bool) -> Dict:
+    """Face detection + models on a decoded frame; returns a 'result' (or NO_FACE result) dict, or an 'error' dict"""
+    frame_id = msg.get('id', 'unknown')
+    video_id = msg.get('videoId', 'unknown')
+    timestamp = msg.get('ts', 0)
+    
+    # Run inference (includes face detection/alignment/SAVING)
+    if log_frame:
+        log.info(f"   🔍 Running inference with {len(MODEL_ITEMS)} models...")
+    results = await infer_using_server(img_bgr, video_id, frame_id, timestamp)
+
+    if 'error' in results:
+        # Send special "no face" result to frontend instead of error
+        error_msg = results['error']
+        if 'no face' in error_msg.lower():
+            if log_frame:
+                log.info(f"   ❌ Inference error: {error_msg}")
+            # Send as a result with special indication
+            resp = {
+                'type': 'result',
+                'id': msg.get('id'),
+                'ts': msg.get('ts'),
+                'prediction': 'NO_FACE',
+                'confidence': 0.0,
+                'error': error_msg,
+                'voting_info': '⚠️ No face detected in frame'
+            }
+            return resp
+        
+        # Other errors - send as error type
+        log.warning(f"   ❌ Inference error: {error_msg}")
+        return {'type': 'error', 'error': error_msg}
+
+    # Extract bbox and saved path from results
+    bbox_norm = results.pop('_bbox', None)
+    saved_face_path = results.pop('_saved_face_path', None)
+    
+    if log_frame:
+        if bbox_norm:
+            log.info(f"   ✓ Face detected: bbox={[f'{x:.3f}' for x in bbox_norm]}")
+        else:
+            log.info(f"   ⚠️  No face bounding box detected (full image used)")
+        
+        # Print results in table format
+        print_frame_analysis(client_frame_number, video_id, timestamp, results, bbox_norm, saved_face_path)
+
+    # Prepare response with voting info
+    ensemble_info = results.get('ENSEMBLE') if isinstance(results, dict) else None
+    
+    # Extract voting info for frontend
+    voting_info = ""
+    if ensemble_info:
+        voting_info = ensemble_info.get('rule', '') + " - " + ensemble_info.get('details', '')
+    elif IS_SINGLE_MODEL:
+        # Single model mode - add conversion info to voting_info (if enabled)
+        model_name = MODEL_NAMES[0]
+        if results[model_name].get('was_converted', False):
+            # Show conversion info only if SHOW_CONVERSION_INFO is True
+            if SHOW_CONVERSION_INFO:
+                orig_pred = results[model_name]['original_prediction']
+                orig_conf = results[model_name]['original_confidence']
+                voting_info = f"Converted: {orig_pred} ({orig_conf:.0%}) → REAL (threshold < {FAKE_THRESHOLD*100:.0f}%)"
+            else:
+                # Hide conversion - just show single model name
+                voting_info = f"Single model: {model_name}"
+        else:
+            voting_info = f"Single model: {model_name}"
+    
+    # Get final prediction and confidence
+    if ensemble_info:
+        final_prediction = ensemble_info.get('prediction')
+        final_confidence = float(ensemble_info.get('confidence', 0.0))
+    elif IS_SINGLE_MODEL:
+        model_name = MODEL_NAMES[0]
+        final_prediction = results[model_name].get('prediction')
+        final_confidence = float(results[model_name].get('confidence', 0.0))
+    else:
+        final_prediction = next(iter(results.values())).get('prediction') if results and isinstance(results, dict) else 'ERROR'
+        final_confidence = 0.0
+    
+    resp = {
+        'type': 'result',
+        'id': msg.get('id'),
+        'ts': msg.get('ts'),
+        'prediction': final_prediction,
+        'confidence': final_confidence,
+        'models': results,
+        'bbox': bbox_norm,
+        'voting_info': voting_info,
+        'saved_face_path': saved_face_path,
+        'source': msg.get('source', 'extension')
+    }
+    
+    return resp
 
 # WebSocket handler - FIXED for websockets v13+
 async def handler(ws):
@@ -473,198 +1078,103 @@ async def handler(ws):
     global frame_count, session_start_time
     
     client_addr = ws.remote_address
-    print(f"\n{'='*140}")
-    print(f"🔌 [DF SERVER] Client connected: {client_addr}")
-    print(f"   Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"{'='*140}")
+    log.info(f"\n{'='*140}")
+    log.info(f"🔌 [DF SERVER] Client connected: {client_addr}")
+    log.info(f"   Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    log.info(f"{'='*140}")
     
     if session_start_time is None:
         session_start_time = time.time()
     
     client_frame_count = 0
+    recent_frames = OrderedDict()  # Near-duplicate cache, for this connection only
     
     try:
         async for raw_msg in ws:
+            frame_bytes = None
             try:
-                msg = json.loads(raw_msg)
+                if isinstance(raw_msg, bytes):
+                    # Binary frame: JSON header + raw JPEG, no base64 round-trip
+                    msg, frame_bytes = unpack_binary_frame(raw_msg)
+                else:
+                    # Text frame (legacy clients): base64 'frameB64' data URL
+                    msg = orjson.loads(raw_msg)
             except Exception as e:
-                print(f"❌ [DF SERVER] Invalid JSON received: {e}")
-                await ws.send(json.dumps({'type': 'error', 'error': 'invalid json'}))
+                log.warning(f"❌ [DF SERVER] Invalid JSON received: {e}")
+                await send_json(ws, {'type': 'error', 'error': 'invalid json'})
                 continue
 
             if AUTH_TOKEN:
                 if msg.get('token') != AUTH_TOKEN:
-                    print(f"❌ [DF SERVER] Invalid auth token from {client_addr}")
-                    await ws.send(json.dumps({'type': 'error', 'error': 'invalid token'}))
+                    log.warning(f"❌ [DF SERVER] Invalid auth token from {client_addr}")
+                    await send_json(ws, {'type': 'error', 'error': 'invalid token'})
                     continue
 
             if msg.get('type') == 'frame':
                 frame_start_time = time.time()
-                frame_count += 1
                 client_frame_count += 1
                 
-                frame_id = msg.get('id', 'unknown')
-                video_id = msg.get('videoId', 'unknown')
-                timestamp = msg.get('ts', 0)
-                frame_b64 = msg.get('frameB64')
-                
-                # Get source flag and upload metadata
-                source = msg.get('source', 'extension')
-                current_frame = msg.get('currentFrame', 0)
-                total_frames = msg.get('totalFrames', 0)
-                video_duration = msg.get('videoDuration', 0)
-                
-                print(f"\n📥 [DF SERVER] Received frame #{client_frame_count} (ID: {frame_id[:8]}...) from {source} - video {video_id} @ {timestamp}s")
-                
-                if not frame_b64:
-                    print(f"❌ [DF SERVER] No frame data provided")
-                    await ws.send(json.dumps({'type': 'error', 'error': 'no frame provided'}))
-                    continue
-
-                # Decode frame
-                decode_start = time.time()
-                try:
-                    img_bgr = b64_to_bgr_img(frame_b64)
-                    decode_time = time.time() - decode_start
-                    print(f"   ✓ Frame decoded: {img_bgr.shape[1]}x{img_bgr.shape[0]} ({decode_time:.3f}s)")
-                except Exception as e:
-                    print(f"❌ [DF SERVER] Failed to decode frame: {e}")
-                    await ws.send(json.dumps({'type': 'error', 'error': f'failed to decode frame: {e}'}))
-                    continue
-
-                # Run inference (includes face detection/alignment/SAVING)
-                print(f"   🔍 Running inference with {len(server_instance.models)} models...")
-                loop = asyncio.get_running_loop()
-                results = await loop.run_in_executor(None, infer_using_server, img_bgr, video_id, frame_id, timestamp)
-
-                if 'error' in results:
-                    print(f"   ❌ Inference error: {results['error']}")
-                    
-                    # Send special "no face" result to frontend instead of error
-                    error_msg = results['error']
-                    if 'no face' in error_msg.lower():
-                        # Send as a result with special indication
-                        resp = {
-                            'type': 'result',
-                            'id': msg.get('id'),
-                            'ts': msg.get('ts'),
-                            'prediction': 'NO_FACE',
-                            'confidence': 0.0,
-                            'error': error_msg,
-                            'voting_info': '⚠️ No face detected in frame'
-                        }
-                        await ws.send(json.dumps(resp))
-                    else:
-                        # Other errors - send as error type
-                        await ws.send(json.dumps({'type': 'error', 'error': error_msg}))
-                    
-                    continue
-
-                # Extract bbox and saved path from results
-                bbox_norm = results.pop('_bbox', None)
-                saved_face_path = results.pop('_saved_face_path', None)
-                
-                if bbox_norm:
-                    print(f"   ✓ Face detected: bbox={[f'{x:.3f}' for x in bbox_norm]}")
-                else:
-                    print(f"   ⚠️  No face bounding box detected (full image used)")
-
-                # Print results in table format
-                print_frame_analysis(client_frame_count, video_id, timestamp, results, bbox_norm, saved_face_path)
-
-                # Prepare response with voting info
-                ensemble_info = results.get('ENSEMBLE') if isinstance(results, dict) else None
-                
-                # Check if single model mode
-                is_single_model = len(server_instance.models) == 1
-                
-                # Extract voting info for frontend
-                voting_info = ""
-                if ensemble_info:
-                    voting_info = ensemble_info.get('rule', '') + " - " + ensemble_info.get('details', '')
-                elif is_single_model:
-                    # Single model mode - add conversion info to voting_info (if enabled)
-                    model_name = list(server_instance.models.keys())[0]
-                    if results[model_name].get('was_converted', False):
-                        # Show conversion info only if SHOW_CONVERSION_INFO is True
-                        if SHOW_CONVERSION_INFO:
-                            orig_pred = results[model_name]['original_prediction']
-                            orig_conf = results[model_name]['original_confidence']
-                            voting_info = f"Converted: {orig_pred} ({orig_conf:.0%}) → REAL (threshold < {FAKE_THRESHOLD*100:.0f}%)"
-                        else:
-                            # Hide conversion - just show single model name
-                            voting_info = f"Single model: {model_name}"
-                    else:
-                        voting_info = f"Single model: {model_name}"
-                
-                # Get final prediction and confidence
-                if ensemble_info:
-                    final_prediction = ensemble_info.get('prediction')
-                    final_confidence = float(ensemble_info.get('confidence', 0.0))
-                elif is_single_model:
-                    model_name = list(server_instance.models.keys())[0]
-                    final_prediction = results[model_name].get('prediction')
-                    final_confidence = float(results[model_name].get('confidence', 0.0))
-                else:
-                    final_prediction = next(iter(results.values())).get('prediction') if results and isinstance(results, dict) else 'ERROR'
-                    final_confidence = 0.0
-                
-                resp = {
-                    'type': 'result',
-                    'id': msg.get('id'),
-                    'ts': msg.get('ts'),
-                    'prediction': final_prediction,
-                    'confidence': final_confidence,
-                    'models': results,
-                    'bbox': bbox_norm,
-                    'voting_info': voting_info,
-                    'saved_face_path': saved_face_path,
-                    'source': msg.get('source', 'extension')
-                }
-                
-                # Add progress info for web uploads
-                if source == 'web_upload' and total_frames > 0:
-                    progress_percent = (current_frame / total_frames) * 100
-                    current_second = int(timestamp)
-                    total_seconds = int(video_duration)
-                    
-                    resp['progress'] = progress_percent
-                    resp['currentFrame'] = current_frame
-                    resp['totalFrames'] = total_frames
-                    resp['currentSecond'] = current_second
-                    resp['totalSeconds'] = total_seconds
-                    resp['isComplete'] = current_frame >= total_frames
-                    
-                    print(f"   📊 Progress: {progress_percent:.1f}% ({current_second}s / {total_seconds}s)")
+                resp = await analyze_frame(msg, frame_bytes, client_frame_count, recent_frames)
                 
                 # Send response
                 send_start = time.time()
-                await ws.send(json.dumps(resp))
+                await send_json(ws, resp)
                 send_time = time.time() - send_start
                 
                 total_frame_time = time.time() - frame_start_time
-                print(f"   ✓ Response sent ({send_time:.3f}s) | Total frame time: {total_frame_time:.3f}s")
+                if is_logged_frame(client_frame_count):
+                    log.info(f"   ✓ Response sent ({send_time:.3f}s) | Total frame time: {total_frame_time:.3f}s")
+                    print_session_stats()
+
+            elif msg.get('type') == 'frame_batch':
+                # Several frames in one message; binary batches carry the JPEGs back to back
+                # in header order, each frame entry giving its byte 'size'. Fields set on the
+                # batch itself (videoId, source, totalFrames, ...) apply to every frame.
+                batch_start_time = time.time()
+                frame_msgs = msg.get('frames') or []
+                shared = {key: value for key, value in msg.items() if key not in ('type', 'frames')}
                 
-                # Print session stats every 10 frames
-                if client_frame_count % 10 == 0:
+                analyses = []
+                offset = 0
+                for frame_msg in frame_msgs:
+                    frame_msg = {'videoId': 'unknown', **shared, **frame_msg}
+                    frame_part = None
+                    if frame_bytes is not None:
+                        size = int(frame_msg.get('size', 0))
+                        frame_part = frame_bytes[offset:offset + size]
+                        offset += size
+                    
+                    client_frame_count += 1
+                    analyses.append(analyze_frame(frame_msg, frame_part, client_frame_count, recent_frames))
+                
+                # Frames of a batch are analyzed concurrently; results keep the request order
+                batch_results = await asyncio.gather(*analyses)
+                await send_json(ws, {'type': 'batch_result', 'results': batch_results})
+                
+                batch_time = time.time() - batch_start_time
+                if any(is_logged_frame(number) for number in range(client_frame_count - len(batch_results) + 1, client_frame_count + 1)):
+                    log.info(f"   ✓ Batch of {len(batch_results)} frames answered | Total batch time: {batch_time:.3f}s")
                     print_session_stats()
 
             else:
-                print(f"❌ [DF SERVER] Unknown message type: {msg.get('type')}")
-                await ws.send(json.dumps({'type': 'error', 'error': 'unknown message type'}))
+                log.warning(f"❌ [DF SERVER] Unknown message type: {msg.get('type')}")
+                await send_json(ws, {'type': 'error', 'error': 'unknown message type'})
 
     except websockets.exceptions.ConnectionClosed:
-        print(f"\n{'='*140}")
-        print(f"🔌 [DF SERVER] Connection closed: {client_addr}")
-        print(f"   Frames processed in this session: {client_frame_count}")
+        log.info(f"\n{'='*140}")
+        log.info(f"🔌 [DF SERVER] Connection closed: {client_addr}")
+        log.info(f"   Frames processed in this session: {client_frame_count}")
         print_session_stats()
-        print(f"{'='*140}\n")
+        log.info(f"{'='*140}\n")
     except Exception as e:
-        print(f"\n❌ [DF SERVER] Handler exception: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception(f"\n❌ [DF SERVER] Handler exception: {e}")
 
 async def main():
+    global batch_scheduler
+    
+    batch_scheduler = BatchScheduler(max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    batch_scheduler.start()
+    
     print("\n" + "="*140)
     print(f"🚀 [DF SERVER] WebSocket server starting...")
     print(f"   Host: {HOST}")
@@ -674,22 +1184,40 @@ async def main():
     print(f"   REAL Confidence Boost: +{REAL_BOOST*100:.1f}% (added to all REAL predictions, capped at 100%)")
     print(f"   Frontend Display: {'Show conversion details ℹ️' if SHOW_CONVERSION_INFO else 'Hide conversion (natural) 🔒'}")
     print(f"   Preprocessed Faces Directory: {PREPROCESSED_FACES_DIR}")
+    print(f"   Batching: up to {args.max_batch} faces, {args.max_wait_ms:g} ms wait")
+    print(f"   Engine: {args.engine}{' (compiled)' if args.compile and args.engine == 'torch' else ''}"
+          f"{' (CUDA graphs)' if any(isinstance(model, CudaGraphModel) for _, model in MODEL_ITEMS) else ''}")
+    print(f"   Face detection size: {f'max side {args.detect_max_side}px' if args.detect_max_side > 0 else 'full resolution'}")
+    print(f"   Near-duplicate frames: {f'reuse result within {DEDUP_DISTANCE} bit(s)' if DEDUP_DISTANCE >= 0 else 'always analyzed'}")
+    print(f"   Precision: {'bf16 autocast' if USE_AUTOCAST else 'FP32'}")
+    print(f"   Event loop: {'uvloop' if uvloop is not None else 'asyncio'}")
+    print(f"   Frame logging: every {LOG_EVERY} frame(s) per client")
     print(f"   Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*140)
     
-    async with websockets.serve(handler, HOST, PORT):
+    # Raised message size limit: frame batches carry several JPEGs per message
+    # No permessage-deflate: frames are JPEG (incompressible) and replies are small, so
+    # compressing only copies every message through zlib buffers in both directions
+    async with websockets.serve(handler, HOST, PORT, max_size=16 * 1024 * 1024, compression=None):
         print(f"\n✅ [DF SERVER] Listening on ws://{HOST}:{PORT}")
         print(f"   Waiting for connections...\n")
         await asyncio.Future()  # run forever
 
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        if uvloop is not None:
+            uvloop.run(main())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
-        print("\n" + "="*140)
-        print("🛑 [DF SERVER] Server stopped manually (Ctrl+C)")
+        log.info("\n" + "="*140)
+        log.info("🛑 [DF SERVER] Server stopped manually (Ctrl+C)")
         print_session_stats()
-        print(f"💾 Total faces saved: {saved_faces_count} in {PREPROCESSED_FACES_DIR}")
-        print("="*140)
+        log.info(f"💾 Total faces saved: {saved_faces_count} in {PREPROCESSED_FACES_DIR}")
+        log.info("="*140)
     except asyncio.CancelledError:
-        pass
\ No newline at end of file
+        pass
+    finally:
+        # Let queued face writes and log records finish
+        SAVE_POOL.shutdown(wait=True)
+        log_listener.stop()
\ No newline at end of file